@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Type
+
+import socketio
+
+from client.bot_interface import BotInterface
+from client.client import ClientHost
+from client.util import silent_stdout
+from games.game_interface import GameInterface
+
+
+class ServerProcess:
+
+    """start_server.py running in a child process, for the duration of a benchmark."""
+
+    def __init__(self, port: int, args: List[str] = ()):
+        self.port = port
+        self.args = list(args)
+        self.process = None
+
+    @property
+    def url(self):
+        return f'http://localhost:{self.port}'
+
+    def __enter__(self):
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'start_server.py')
+        self.process = subprocess.Popen([sys.executable, script, '--port', str(self.port), *self.args],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Benchmark:
+
+    """Ramp up the number of bots playing on a server, and measure the server at each step.
+
+    At each step, nb_client bots queue for games until duration seconds have passed, then the statistics of the server
+    are collected: throughput, round trips of the game events (p50, p95, p99), cpu and memory per game. The server
+    must run the game_class game.
+    """
+
+    Events = ('turn', 'action', 'kill')  # Round trips shown in the report, every event is kept in the results
+
+    def __init__(self, url: str, game_class: Type[GameInterface], bot_class: Type[BotInterface], steps: List[int],
+                 duration: float = 10.0, json_module=None, stagger: float = 0.001):
+        for nb_client in steps:
+            # The matchmaking queue would never start a game for the last bots
+            if 0 < nb_client % game_class.MaxPlayer < game_class.MinPlayer:
+                raise ValueError(f'{nb_client} bots cannot be split in games of {game_class.MinPlayer} to '
+                                 f'{game_class.MaxPlayer} players')
+        self.url = url
+        self.bot_class = bot_class
+        self.steps = steps
+        self.duration = duration
+        self.json_module = json_module
+        self.stagger = stagger
+        self.stats_socket = None
+
+    async def connect(self, timeout=10.0):
+        # The server may still be starting
+        self.stats_socket = socketio.AsyncClient(reconnection=False, logger=False, json=self.json_module)
+        started_at = time.monotonic()
+        while True:
+            try:
+                await self.stats_socket.connect(self.url)
+                return
+            except socketio.exceptions.ConnectionError:
+                if time.monotonic() - started_at > timeout:
+                    raise
+                await asyncio.sleep(0.2)
+
+    async def server_stats(self, reset=False):
+        return await self.stats_socket.call('server_stats', reset)
+
+    async def play_round(self, nb_client):
+        host = ClientHost(self.url, json=self.json_module, stagger=self.stagger)
+        for _ in range(nb_client):
+            host.add(self.bot_class(self.url, join_queue=True))
+        await host.run()
+
+    async def run_step(self, nb_client):
+        await self.server_stats(reset=True)
+        started_at = time.monotonic()
+        rounds = 0
+        while time.monotonic() - started_at < self.duration:
+            await self.play_round(nb_client)
+            rounds += 1
+        return {'clients': nb_client, 'rounds': rounds, **await self.server_stats(reset=True)}
+
+    async def run(self):
+        await self.connect()
+        results = []
+        try:
+            for nb_client in self.steps:
+                with silent_stdout():
+                    result = await self.run_step(nb_client)
+                print(self.format_step(result))
+                results.append(result)
+        finally:
+            await self.stats_socket.disconnect()
+        return results
+
+    @classmethod
+    def format_step(cls, result: Dict):
+        def ms(seconds):
+            return f'{seconds * 1000:7.1f}' if seconds is not None else '      -'
+
+        def per_game(value, unit, scale=1):
+            return f'{value / scale:.2f}{unit}' if value is not None else '-'
+
+        lines = [f"{result['clients']:>5} clients: {result['games']} games, {result['turns']} turns in "
+                 f"{result['elapsed']:.1f}s ({result['games_per_sec']:.2f} games/sec, "
+                 f"{result['turns_per_sec']:.1f} turns/sec), "
+                 f"cpu {per_game(result['cpu_per_game'], 's', 1)} and memory "
+                 f"{per_game(result['memory_per_game'], 'MB', 2 ** 20)} per game"]
+        for event in cls.Events:
+            trips = result['round_trips'].get(event, {'count': 0, 'p50': None, 'p95': None, 'p99': None})
+            lines.append(f"        {event:<8} p50 {ms(trips['p50'])}ms  p95 {ms(trips['p95'])}ms  "
+                         f"p99 {ms(trips['p99'])}ms  ({trips['count']} round trips)")
+        return '\n'.join(lines)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: str, settings: Dict, results: List[Dict]):
+    with open(path, 'w') as file:
+        json.dump({'revision': git_revision(), 'date': time.time(), 'settings': settings, 'steps': results}, file,
+                  indent=2)
+
+
+def compare_results(baseline_path: str, results: List[Dict]):
+    """Relative change of the throughput and latencies of each step, against a previous result file."""
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    previous_steps = {step['clients']: step for step in baseline['steps']}
+
+    def change(old, new):
+        return f'{(new - old) / old:+.1%}' if old and new is not None else '-'
+
+    lines = [f"Compared to revision {baseline['revision']}:"]
+    for step in results:
+        previous = previous_steps.get(step['clients'])
+        if previous is None:
+            continue
+        cells = [f"turns/sec {change(previous['turns_per_sec'], step['turns_per_sec'])}"]
+        for event in Benchmark.Events:
+            old, new = previous['round_trips'].get(event), step['round_trips'].get(event)
+            if old and new:
+                cells.append(f"{event} p95 {change(old['p95'], new['p95'])}")
+        lines.append(f"{step['clients']:>5} clients: " + ', '.join(cells))
+    return '\n'.join(lines)
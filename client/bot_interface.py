@@ -7,10 +7,16 @@ from games.game_interface import Game
 
 class BotInterface(ABC):
 
-    def __init__(self, host, join_random_game=False, game_id=None):
+    fused_turn = False  # Receive the state update with the turn request, instead of a separate update event
+    log_level = Game.LogLevel.Off  # Verbosity of the game log received at the end of each turn
+    legal_moves = None  # Legal moves of the current turn, sent with the turn request (see games.Coup.legal)
+    state_delta = None  # Fields of the game_state changed by the last update_delta, the whole state after a snapshot
+
+    def __init__(self, host, join_random_game=False, game_id=None, join_queue=False):
         self.host = host
         self.join_random_game = join_random_game
         self.game_id = game_id
+        self.join_queue = join_queue
 
     def start_condition(self, nb_player):
         return nb_player > 2
@@ -30,11 +36,12 @@ class BotInterface(ABC):
 class CoupInterface(BotInterface):
 
     @abstractmethod
-    async def on_action(self, sender, target, action_type) -> Optional[Game.Action]:
+    async def on_action(self, sender, target, action_type, deadline=None) -> Optional[Game.Action]:
+        # deadline is the wall clock timestamp (time.time()) after which the reaction is too late
         raise NotImplementedError()
 
     @abstractmethod
-    async def on_block(self, sender, target, block_with) -> Optional[Challenge]:
+    async def on_block(self, sender, target, block_with, deadline=None) -> Optional[Challenge]:
         raise NotImplementedError()
 
     @abstractmethod
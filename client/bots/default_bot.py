@@ -4,6 +4,7 @@ from typing import Tuple, List
 
 from client.bot_interface import CoupInterface
 from games import CoupGame
+from games.Coup import legal
 from games.Coup.actions import Coup, Duke, Captain, Challenge, ForeignAid, Income, Assassin, Contessa, Inquisitor, \
     Ambassador
 from games.game_interface import Game
@@ -13,6 +14,8 @@ class DefaultBot(CoupInterface):
 
     # Define your stuff here
     game_state = None
+    alive_influences = ()  # Decoded once per update, instead of on each access
+    fused_turn = True  # The game state comes with the turn request
 
     def start_condition(self, nb_player):
         # Condition for a game owner to start the current game. Not use if you are not the game owner
@@ -23,11 +26,6 @@ class DefaultBot(CoupInterface):
         # Raise when the game start. Initialize stuff here.
         pass
 
-    @property
-    def alive_influences(self):
-        if self.game_state:
-            return tuple(CoupGame.deserialize_action(inf['action']) for inf in self.game_state['you']['influences'] if inf['alive'])
-
     @property
     def is_alive(self):
         if self.game_state:
@@ -46,7 +44,7 @@ class DefaultBot(CoupInterface):
 
     async def on_turn(self):
         if self.game_state['you']['coins'] >= 7:
-            return Coup(), random.choice(self.alive_players_id)
+            return self.legal(Coup(), random.choice(self.alive_players_id))
 
         actions = [Income(), ForeignAid(), Duke(), Captain(), Ambassador(), Inquisitor()]
         if self.game_state['you']['coins'] >= 3:
@@ -63,27 +61,36 @@ class DefaultBot(CoupInterface):
         else:
             target = None
 
-        return action, target
+        return self.legal(action, target)
+
+    def legal(self, action, target):
+        # Never send an illegal move, it eliminates the bot. A random legal move is played instead.
+        if self.legal_moves is None or legal.is_legal(self.legal_moves, action, target):
+            return action, target
+        action, target = random.choice(list(legal.legal_moves(self.legal_moves)))
+        return action(), target
 
     async def on_update(self, game_state):
         # If an influence from another player is not dead, it will be shown as a generic Action
         self.game_state = game_state
+        self.alive_influences = tuple(CoupGame.deserialize_action(inf['action'])
+                                      for inf in game_state['you']['influences'] if inf['alive'])
         # print(self.game_state, sep='\n')
 
-    async def on_action(self, sender, target, action):
+    async def on_action(self, sender, target, action, deadline=None):
         #  answer with an action to block or to challenge, otherwise pass
         print('-'*50)
         action = CoupGame.deserialize_action(action)
         if target is None:
-            print(f'Player {sender} use {action["type"]}')
+            print(f'Player {sender} use {action}')
         else:
-            print(f'Player {sender} use {action["type"]} on player {target}')
+            print(f'Player {sender} use {action} on player {target}')
 
         if sender == self.my_player_id or not self.is_alive:
             return
 
         # Randomly challenge other players:
-        if random.random() > 0.8 and not type(action) in {Income, ForeignAid, Coup}:
+        if random.random() > 0.8 and type(action) not in legal.Unchallengeable:
             print(f'Challenge from {self.my_player_id}!')
             return Challenge()
 
@@ -101,7 +108,7 @@ class DefaultBot(CoupInterface):
                 if random.random() > 0.9:
                     return random.choice((Inquisitor(), Captain()))
 
-    async def on_block(self, sender, target, block_with):
+    async def on_block(self, sender, target, block_with, deadline=None):
         action = CoupGame.deserialize_action(block_with)
         print(f'Player {sender} tried to block player {target} with {action}')
         # Randomly challenge block
@@ -1,34 +1,38 @@
 
+import asyncio
 import socketio
 import inspect
+from typing import List
 
 from client.bot_interface import BotInterface
+from games.delta import StateTracker
 
 
 class Client(socketio.AsyncClientNamespace):
-    bot = None
-    sio = None
-    host = None
 
-    @classmethod
-    def configure(cls, sio: socketio.AsyncClient, host: str, bot: BotInterface):
+    """Connection of one bot to the game server. The client registers itself on its socket.io client."""
 
-        cls.bot = bot
-        cls.sio = sio
-        cls.host = host
+    def __init__(self, sio: socketio.AsyncClient, host: str, bot: BotInterface):
+        super().__init__()
+        self.bot = bot
+        self.sio = sio
+        self.host = host
+        self.tracker = StateTracker()
 
-        client_methods = [m[0] for m in inspect.getmembers(cls, predicate=inspect.isfunction) if m[0].startswith('on_')]
-        for method in inspect.getmembers(cls.bot, predicate=inspect.ismethod):
+        client_methods = [m[0] for m in inspect.getmembers(type(self), predicate=inspect.isfunction) if m[0].startswith('on_')]
+        for method in inspect.getmembers(self.bot, predicate=inspect.ismethod):
             if method[0] in client_methods:
                 raise NameError(f'A event handler for {method[0]} already exists in the client interface.')
-            if method[0].startswith('on_'):
-                cls.sio.on(method[0].replace('on_', '', 1), handler=method[1])
+            if method[0] == 'on_turn':
+                self.sio.on('turn', handler=self.turn_request)
+            elif method[0].startswith('on_'):
+                self.sio.on(method[0].replace('on_', '', 1), handler=method[1])
+        self.sio.register_namespace(self)
 
-    @classmethod
-    async def start(cls):
-        await cls.sio.connect(cls.host)
-        await cls.sio.wait()
-        await cls.sio.disconnect()
+    async def start(self):
+        await self.sio.connect(self.host)
+        await self.sio.wait()
+        await self.sio.disconnect()
 
     @staticmethod
     async def on_disconnect():
@@ -41,6 +45,30 @@ class Client(socketio.AsyncClientNamespace):
     async def on_game_start(self, *args):
         await self.bot.start(*args)
 
+    async def on_update_delta(self, message):
+        game_state = self.tracker.apply(message)
+        if game_state is not None:
+            self.bot.state_delta = self.tracker.delta
+            await self.bot.on_update(game_state)
+
+    async def turn_request(self, update_event=None, message=None, legal_moves=None):
+        # A fused turn request carries the update of the player, which is applied before the turn is played. The legal
+        # moves come last.
+        self.bot.legal_moves = legal_moves
+        if update_event == 'update_delta':
+            game_state = self.tracker.apply(message)
+            if game_state is not None:
+                self.bot.state_delta = self.tracker.delta
+                await self.bot.on_update(game_state)
+        elif update_event == 'update':
+            await self.bot.on_update(message)
+        return await self.bot.on_turn()
+
+    @staticmethod
+    def on_game_log(log):
+        for msg in log['entries']:
+            print(msg)
+
     async def on_game_aborted(self, game_uuid):
         await self.disconnect()
 
@@ -50,7 +78,10 @@ class Client(socketio.AsyncClientNamespace):
 
     async def on_connect(self):
         # TODO add a bot name
-        if self.bot.join_random_game:
+        await self.sio.emit('set_protocol', {'fused_turn': self.bot.fused_turn, 'log_level': int(self.bot.log_level)})
+        if self.bot.join_queue:
+            await self.sio.emit('queue_for_game')
+        elif self.bot.join_random_game:
             await self.sio.emit('find_random_game', callback=self.join_game)
         elif not self.bot.game_id:
             await self.sio.emit('create_game', callback=self.join_game)  # TODO pass game settings from game bot
@@ -66,3 +97,35 @@ class Client(socketio.AsyncClientNamespace):
     async def on_player_joined_game(self, game_uuid, nb_player, is_game_owner):
         if is_game_owner and self.bot.start_condition(nb_player):
             await self.sio.emit('start_game', game_uuid)
+
+
+class ClientHost:
+
+    """Run many bots on a single event loop, each with its own socket.io connection.
+
+    The bots are started one after the other, stagger seconds apart, so a game created by the first bot exists by the
+    time the next ones look for it, and the server does not get all the connections at once.
+    """
+
+    def __init__(self, host: str, json=None, stagger: float = 0.05):
+        self.host = host
+        self.json = json
+        self.stagger = stagger
+        self.clients: List[Client] = []
+
+    def add(self, bot: BotInterface) -> Client:
+        sio = socketio.AsyncClient(reconnection=False, logger=False, json=self.json)
+        client = Client(sio, self.host, bot)
+        self.clients.append(client)
+        return client
+
+    async def run(self):
+        # A bot failing to connect or crashing does not stop the others
+        tasks = []
+        for client in self.clients:
+            tasks.append(asyncio.ensure_future(client.start()))
+            await asyncio.sleep(self.stagger)
+
+        for client, result in zip(self.clients, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                print(f'Bot {type(client.bot).__name__} stopped: {result!r}')
@@ -0,0 +1,483 @@
+import asyncio
+import multiprocessing
+import random
+from enum import IntEnum
+from itertools import combinations
+from multiprocessing import shared_memory
+from typing import Optional, Sequence, Type
+
+import numpy as np
+
+from client.bot_interface import CoupInterface
+from client.bots.default_bot import DefaultBot
+from client.observation import Cards, CardIndex, MaxPlayer, StateEncoder, StateSize
+from client.util import silent_stdout
+from games import CoupGame
+from games.Coup import legal
+from games.Coup.actions import ActionCode, Duke, Contessa, Captain, Ambassador, Inquisitor, Challenge
+from games.Coup.legal import TurnActions
+from games.game_interface import Game
+from games.log import configure_logging
+from games.transport import LocalTransport
+
+
+class Decision(IntEnum):
+    # Callbacks of CoupInterface answered by the agent, the meaning of the action index depends on it
+    Turn = 0  # TurnActions index * NbTarget + target public id + 1 (0 for no target)
+    Action = 1  # Reactions index
+    Block = 2  # Pass or Challenge, the two first Reactions
+    Kill = 3  # Index of the alive influence given up
+    Swap = 4  # Discards index, in the alive influences then the drawn cards
+    Replace = 5  # Inquisitor lookup: 0 to keep the card of the target, 1 to replace it
+    Lookup = 6  # Index of the alive influence shown to the Inquisitor
+
+
+Reactions = (None, Challenge, Duke, Contessa, Captain, Ambassador, Inquisitor)
+Discards = (*combinations(range(4), 2), *((index,) for index in range(3)))
+NbTarget = MaxPlayer + 1
+NbAction = len(TurnActions) * NbTarget
+
+# Observation layout: the features of the StateEncoder, then the pending decision
+DecisionOffset = StateSize
+SenderOffset = DecisionOffset + len(Decision)  # Seat of the player of the action or the block
+TargetOffset = SenderOffset + MaxPlayer  # Seat targeted by the action or the block
+ActionOffset = TargetOffset + MaxPlayer  # ActionCode of the action or the block
+CandidatesOffset = ActionOffset + len(ActionCode)  # Cards offered by a swap or a lookup, one hot
+ObservationSize = CandidatesOffset + 4 * len(Cards)
+
+
+def action_code(action):
+    # ActionCode of a wire action or an action
+    if isinstance(action, dict):
+        action = CoupGame.Actions.get(action.get('type'))
+        return action.code if action is not None else ActionCode.Hidden
+    return action.code
+
+
+class AgentBot(CoupInterface):
+
+    """Bot whose answers are the actions given to CoupVecEnv.step.
+
+    Each callback asking for a decision waits for the next action, while the other games keep running.
+    """
+
+    def __init__(self, env: 'CoupEnvGroup', index):
+        super().__init__(None)
+        self.env = env
+        self.index = index
+        self.game_state = None
+        self.encoder = StateEncoder()
+        self.decision = None
+        self.context = {}
+        self.player: Optional[Game.Player] = None  # Player of the agent in the game, set once the game is created
+        self.answer: Optional[asyncio.Future] = None  # Answer of the last decision
+        self.shown: Optional[asyncio.Future] = None  # Answer of the decision in the observation buffer
+
+    @property
+    def my_player_id(self):
+        return self.encoder.pid
+
+    @property
+    def alive_influences(self):
+        return list(self.encoder.influences)
+
+    async def decide(self, decision: Decision, **context):
+        # None when the game moves on before the decision is taken, like a reaction window closed by another player
+        if self.answer is not None and not self.answer.done():
+            self.answer.set_result(None)
+        self.decision = decision
+        self.context = context
+        self.answer = answer = asyncio.get_event_loop().create_future()
+        self.env.resolve(self.index, self)
+        try:
+            return await answer
+        finally:
+            if self.answer is answer:
+                self.decision = None
+
+    async def on_update(self, game_state):
+        self.game_state = game_state
+        # Only the fields changed by the update are encoded again
+        self.encoder.update(self.state_delta if self.state_delta is not None else game_state)
+        if not game_state['you']['alive']:
+            self.env.resolve(self.index, self)
+
+    async def on_turn(self):
+        index = await self.decide(Decision.Turn)
+        action, target = divmod(index, NbTarget)
+        if not 0 <= action < len(TurnActions):
+            return Game.Action()
+        return TurnActions[action](), target - 1 if target else None
+
+    async def on_action(self, sender, target, action, deadline=None):
+        # Income and Coup are only announced, and nobody reacts to its own action or once eliminated
+        if sender == self.my_player_id or action_code(action) in (ActionCode.Income, ActionCode.Coup) or \
+                not self.player.alive:
+            return
+        index = await self.decide(Decision.Action, sender=sender, target=target, action=action)
+        if index is None:
+            return
+        reaction = Reactions[index] if 0 <= index < len(Reactions) else Game.Action
+        return reaction() if reaction is not None else None
+
+    async def on_block(self, sender, target, block_with, deadline=None):
+        if sender == self.my_player_id or not self.player.alive:
+            return
+        index = await self.decide(Decision.Block, sender=sender, target=target, action=block_with)
+        if index is None:
+            return
+        return Challenge() if index == 1 else None if index == 0 else Game.Action()
+
+    async def on_kill(self):
+        influences = self.alive_influences
+        index = await self.decide(Decision.Kill)
+        return influences[index] if 0 <= index < len(influences) else Game.Action()
+
+    async def on_swap(self, target, cards):
+        cards = [CoupGame.deserialize_action(card) for card in cards]
+        if target != self.my_player_id:
+            index = await self.decide(Decision.Replace, target=target, candidates=cards)
+            return cards[0] if index == 1 else None if index == 0 else Game.Action()
+
+        candidates = self.alive_influences + cards
+        index = await self.decide(Decision.Swap, candidates=candidates)
+        if not 0 <= index < len(Discards) or max(Discards[index]) >= len(candidates):
+            return [Game.Action()]
+        return [candidates[i] for i in Discards[index]]
+
+    async def on_lookup(self):
+        influences = self.alive_influences
+        index = await self.decide(Decision.Lookup)
+        return influences[index] if 0 <= index < len(influences) else Game.Action()
+
+    def observe(self, out: np.ndarray):
+        """Write the observation of the pending decision in out, a row of the observation buffer."""
+        out[:StateSize] = self.encoder.features
+        out[StateSize:] = 0
+        out[DecisionOffset + self.decision] = 1
+        context = self.context
+        if context.get('sender') is not None:
+            out[SenderOffset + self.encoder.seat(context['sender'])] = 1
+        if context.get('target') is not None:
+            out[TargetOffset + self.encoder.seat(context['target'])] = 1
+        if context.get('action') is not None:
+            out[ActionOffset + action_code(context['action'])] = 1
+        for slot, card in enumerate(context.get('candidates', ())):
+            out[CandidatesOffset + slot * len(Cards) + CardIndex[card.code]] = 1
+
+    def legal_mask(self, out: np.ndarray):
+        """Write the mask of the legal actions of the pending decision in out, a row of the mask buffer."""
+        out[:] = False
+        decision = self.decision
+        if decision == Decision.Turn:
+            # Same layout as the legal moves sent with the turn request: the bit of the target is its index
+            moves = np.array(self.legal_moves, dtype=np.int64)
+            out[:NbAction] = (moves[:, None] >> np.arange(NbTarget) & 1).ravel()
+
+        elif decision == Decision.Action:
+            moves = legal.reaction_moves(action_code(self.context['action']), self.context['target'] == self.my_player_id)
+            for index, reaction in enumerate(Reactions):
+                out[index] = reaction is None or legal.is_legal_reaction(moves, reaction)
+
+        elif decision == Decision.Block:
+            moves = legal.block_moves(action_code(self.context['action']))
+            for index, reaction in enumerate(Reactions[:2]):
+                out[index] = reaction is None or legal.is_legal_reaction(moves, reaction)
+
+        elif decision == Decision.Replace:
+            out[:2] = True
+
+        elif decision == Decision.Kill or decision == Decision.Lookup:
+            out[:len(self.alive_influences)] = True
+
+        elif decision == Decision.Swap:
+            nb_candidate = len(self.context['candidates'])
+            count = nb_candidate - len(self.alive_influences)
+            for index, discard in enumerate(Discards):
+                out[index] = len(discard) == count and max(discard) < nb_candidate
+
+
+class SharedBuffers:
+
+    """Arrays exchanged with the environments, in a single multiprocessing.shared_memory block.
+
+    The workers write their observations in place, so only a short command goes through the pipes at each step. Without
+    shared=True, the arrays are plain NumPy arrays, for the environments played in the current process.
+    """
+
+    Fields = (
+        ('observations', np.float32, (ObservationSize,)),
+        ('masks', np.bool_, (NbAction,)),
+        ('decisions', np.int8, ()),
+        ('rewards', np.float32, ()),
+        ('dones', np.bool_, ()),
+        ('actions', np.int64, ()),
+    )
+
+    def __init__(self, nb_env, shared=False, name=None):
+        self.nb_env = nb_env
+        shapes = [((nb_env, *shape), np.dtype(dtype)) for _, dtype, shape in self.Fields]
+        offsets, size = [], 0
+        for shape, dtype in shapes:
+            size = -(-size // 8) * 8  # Aligned on 8 bytes
+            offsets.append(size)
+            size += int(np.prod(shape)) * dtype.itemsize
+
+        self.memory = None
+        if shared or name is not None:
+            self.memory = shared_memory.SharedMemory(name, create=name is None, size=max(size, 1))
+            buffer = self.memory.buf
+        else:
+            buffer = bytearray(max(size, 1))
+        for (field, _, _), (shape, dtype), offset in zip(self.Fields, shapes, offsets):
+            setattr(self, field, np.ndarray(shape, dtype, buffer, offset))
+
+    @property
+    def name(self):
+        return self.memory.name if self.memory is not None else None
+
+    def close(self, unlink=False):
+        if self.memory is None:
+            return
+        for field, _, _ in self.Fields:
+            setattr(self, field, None)  # The views must be released before the memory
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+        self.memory = None
+
+
+class CoupEnvGroup:
+
+    """Games of the environments start to stop - 1, played on their own event loop.
+
+    Each environment is a CoupGame between an AgentBot and opponent bots. The episode ends when the game ends or when
+    the agent is eliminated: the reward is 1 for a win, -1 for a loss and 0 for a tie.
+    """
+
+    DecisionTimeout = 3600.0  # The game waits for the agent between two steps
+
+    def __init__(self, buffers: SharedBuffers, start, stop, nb_player, opponents: Sequence[Type[CoupInterface]],
+                 rng: random.Random):
+        self.buffers = buffers
+        self.indices = range(start, stop)
+        self.nb_player = nb_player
+        self.opponents = opponents
+        self.rng = rng  # Draws the opponents
+        self.loop = asyncio.new_event_loop()
+        self.tasks = {}
+        self.agents = {}
+        self.transports = {}
+        self.agent_sids = {}
+        self.waiting = {}  # Futures done once the environment needs an action, or its episode is over
+
+    def reset(self):
+        for index in self.indices:
+            self.close_game(index)
+        self.run(self.indices, self.new_game)
+
+    def step(self):
+        buffers = self.buffers
+        for index in self.indices:
+            agent = self.agents[index]
+            if agent.shown is not None and not agent.shown.done():
+                agent.shown.set_result(int(buffers.actions[index]))
+        self.run(self.indices)
+
+        done = [index for index in self.indices if buffers.dones[index]]
+        for index in done:
+            self.close_game(index)
+        if done:
+            # Automatic reset, the observation of a finished environment is the first one of the next episode
+            rewards = buffers.rewards[done].copy()
+            self.run(done, self.new_game)
+            buffers.rewards[done] = rewards
+            buffers.dones[done] = True
+
+    def run(self, indices, prepare=None):
+        async def wait():
+            for index in indices:
+                self.waiting[index] = self.loop.create_future()
+                if prepare is not None:
+                    await prepare(index)
+                agent = self.agents[index]
+                if self.tasks[index].done() or \
+                        agent.answer is not None and not agent.answer.done() and agent.answer is not agent.shown:
+                    self.resolve(index, agent)  # Game over, or asked during the previous step after its own decision
+            await asyncio.gather(*(self.waiting[index] for index in indices))
+
+        with silent_stdout():
+            self.loop.run_until_complete(wait())
+
+        buffers = self.buffers
+        for index in indices:
+            agent, task = self.agents[index], self.tasks[index]
+            buffers.rewards[index] = 0.0
+            buffers.dones[index] = agent.decision is None or task.done() or not agent.player.alive
+            if not buffers.dones[index]:
+                agent.observe(buffers.observations[index])
+                agent.legal_mask(buffers.masks[index])
+                buffers.decisions[index] = agent.decision
+                agent.shown = agent.answer
+                continue
+
+            if not task.done() or task.cancelled() or task.exception() is not None:
+                buffers.rewards[index] = -1.0  # Eliminated while the others keep playing
+            elif task.result() is not None:
+                buffers.rewards[index] = 1.0 if task.result() == self.agent_sids[index] else -1.0
+            buffers.masks[index] = False
+            buffers.decisions[index] = -1
+
+    async def new_game(self, index):
+        transport = LocalTransport()
+        agent = AgentBot(self, index)
+        bots = [agent, *(self.rng.choice(self.opponents)(None) for _ in range(self.nb_player - 1))]
+        sids = [transport.connect(bot) for bot in bots]
+
+        game = CoupGame(transport, sids[0], action_timeout=self.DecisionTimeout)
+        for sid in sids:
+            transport.enter_room(sid, game.uuid)
+            await game.add_player(sid)
+        agent.player = game.players[sids[0]]
+        for bot in bots:
+            await bot.start(game.nb_player)
+
+        self.agents[index], self.transports[index], self.agent_sids[index] = agent, transport, sids[0]
+        self.tasks[index] = task = asyncio.ensure_future(game.start())
+        task.add_done_callback(lambda _: self.resolve(index, agent))
+
+    def resolve(self, index, agent: AgentBot):
+        # The agent needs an action, or its episode is over. Late calls from the game of a previous episode are ignored.
+        waiting = self.waiting.get(index)
+        if self.agents.get(index) is agent and waiting is not None and not waiting.done():
+            waiting.set_result(None)
+
+    def close_game(self, index):
+        task = self.tasks.pop(index, None)
+        transport = self.transports.pop(index, None)
+        self.agents.pop(index, None)
+        if task is None:
+            return
+        # Cancelled again until everything stopped: before Python 3.12, wait_for may swallow a cancellation
+        pending = [task, *transport.tasks]
+        while pending:
+            for pending_task in pending:
+                pending_task.cancel()
+            with silent_stdout():
+                self.loop.run_until_complete(asyncio.wait(pending, timeout=0.01))
+            pending = [pending_task for pending_task in (task, *transport.tasks) if not pending_task.done()]
+
+    def close(self):
+        for index in self.indices:
+            self.close_game(index)
+        self.loop.close()
+
+
+def _worker_main(conn, name, nb_env, start, stop, nb_player, opponents, seed):
+    configure_logging('OFF')
+    random.seed(seed)  # The games of the worker draw from the random module
+
+    buffers = SharedBuffers(nb_env, name=name)
+    group = CoupEnvGroup(buffers, start, stop, nb_player, opponents, random.Random(seed))
+    try:
+        while True:
+            command = conn.recv()
+            if command == 'reset':
+                group.reset()
+            elif command == 'step':
+                group.step()
+            else:
+                break
+            conn.send(True)
+    finally:
+        group.close()
+        buffers.close()
+
+
+class CoupVecEnv:
+
+    """Gym-style vector environment: nb_env games of Coup, each between an agent and opponent bots.
+
+    Like a Gymnasium vector environment, reset() returns the observations and the infos, and step(actions) the
+    observations, the rewards, the terminated and truncated flags and the infos. The infos hold the mask of the legal
+    actions and the kind of decision (see Decision) of each environment. An environment is reset as soon as its episode
+    is over. Observations are float32 arrays of ObservationSize, actions are indices below NbAction.
+
+    With nb_process, the environments are split between worker processes. They write the observations in place in
+    shared memory, and only a short command goes through the pipes at each step.
+
+    The seed draws the opponents. The games themselves draw from the random module, which is only seeded in the worker
+    processes: in process, the random module of the caller is left alone.
+    """
+
+    def __init__(self, nb_env: int, nb_player: int = 6, opponents: Sequence[Type[CoupInterface]] = (DefaultBot,),
+                 nb_process: int = 0, seed=None):
+        if not CoupGame.MinPlayer <= nb_player <= CoupGame.MaxPlayer:
+            raise ValueError(f'CoupGame is played with {CoupGame.MinPlayer} to {CoupGame.MaxPlayer} players, '
+                             f'not {nb_player}')
+        self.nb_env = nb_env
+        self.nb_player = nb_player
+        self.nb_process = min(nb_process, nb_env)
+        self.buffers = SharedBuffers(nb_env, shared=self.nb_process > 0)
+        self.group = None
+        self.workers = []
+
+        seeds = random.Random(seed)
+        if not self.nb_process:
+            self.group = CoupEnvGroup(self.buffers, 0, nb_env, nb_player, opponents, random.Random(seeds.getrandbits(32)))
+            return
+
+        bounds = np.linspace(0, nb_env, self.nb_process + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker_main, daemon=True, args=(
+                worker_conn, self.buffers.name, nb_env, start, stop, nb_player, tuple(opponents), seeds.getrandbits(32)))
+            process.start()
+            self.workers.append((process, conn))
+
+    @property
+    def observation_size(self):
+        return ObservationSize
+
+    @property
+    def nb_action(self):
+        return NbAction
+
+    def _run(self, command):
+        if self.group is not None:
+            getattr(self.group, command)()
+            return
+        for _, conn in self.workers:
+            conn.send(command)
+        for _, conn in self.workers:
+            conn.recv()
+
+    def _infos(self):
+        return {'action_mask': self.buffers.masks.copy(), 'decision': self.buffers.decisions.copy()}
+
+    def reset(self):
+        self._run('reset')
+        return self.buffers.observations.copy(), self._infos()
+
+    def step(self, actions):
+        self.buffers.actions[:] = actions
+        self._run('step')
+        buffers = self.buffers
+        truncated = np.zeros(self.nb_env, dtype=bool)
+        return buffers.observations.copy(), buffers.rewards.copy(), buffers.dones.copy(), truncated, self._infos()
+
+    def close(self):
+        if self.group is not None:
+            self.group.close()
+            self.group = None
+        for process, conn in self.workers:
+            conn.send('close')
+            process.join()
+        self.workers.clear()
+        self.buffers.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,85 @@
+from typing import Optional
+
+import numpy as np
+
+from games import CoupGame
+from games.Coup.batch import Cards
+
+CardIndex = {code: index for index, code in enumerate(Cards)}
+
+MaxPlayer = CoupGame.MaxPlayer
+
+# Layout of the features. Seats are relative to the player, the player is seat 0.
+SeatFeatures = 4 + len(Cards)  # Present, alive, coins, hidden influences, then the revealed cards
+SeatsOffset = 0
+HandOffset = SeatsOffset + MaxPlayer * SeatFeatures  # Alive influences of the player, one hot
+CurrentOffset = HandOffset + 2 * len(Cards)  # Seat of the current player
+StateSize = CurrentOffset + MaxPlayer
+
+
+class StateEncoder:
+
+    """Fixed size float32 features of the game_state of a player, updated in place.
+
+    update takes the full game_state, or only the fields that changed, like the state of an update_delta message: the
+    players and the fields missing from it keep their features.
+    """
+
+    def __init__(self, out: Optional[np.ndarray] = None):
+        self.features = np.zeros(StateSize, np.float32) if out is None else out
+        self.seats = self.features[SeatsOffset:HandOffset].reshape(MaxPlayer, SeatFeatures)
+        self.hand = self.features[HandOffset:CurrentOffset].reshape(2, len(Cards))
+        self.current = self.features[CurrentOffset:StateSize]
+        self.pid = None
+        self.seat_of = {}  # Seat of each public id, relative to the player
+        self.influences = ()  # Alive influences of the player, only decoded when they change
+
+    def reset(self):
+        self.features[:] = 0
+        self.pid = None
+        self.seat_of = {}
+        self.influences = ()
+
+    def seat(self, pid):
+        return self.seat_of[int(pid)]
+
+    def update(self, game_state) -> np.ndarray:
+        you = game_state.get('you', {})
+        others = game_state.get('others', {})
+        if 'id' in you:
+            # Only a full state has the id, and every other player. The public ids are not always contiguous.
+            self.pid = you['id']
+            pids = sorted((self.pid, *(int(pid) for pid in others)))
+            me = pids.index(self.pid)
+            self.seat_of = {pid: (index - me) % len(pids) for index, pid in enumerate(pids)}
+
+        self._update_seat(self.seats[0], you)
+        if 'influences' in you:
+            self.influences = tuple(CoupGame.deserialize_action(influence['action'])
+                                    for influence in you['influences'] if influence['alive'])
+            self.hand[:] = 0
+            for slot, influence in enumerate(self.influences):
+                self.hand[slot, CardIndex[influence.code]] = 1
+
+        for pid, player in others.items():
+            self._update_seat(self.seats[self.seat(pid)], player)
+
+        if 'current_player' in game_state:
+            self.current[:] = 0
+            self.current[self.seat(game_state['current_player'])] = 1
+        return self.features
+
+    @staticmethod
+    def _update_seat(row, player):
+        row[0] = 1
+        if 'alive' in player:
+            row[1] = player['alive']
+        if 'coins' in player:
+            row[2] = player['coins']
+        if 'influences' in player:
+            row[3:] = 0
+            for influence in player['influences']:
+                if influence['alive']:
+                    row[3] += 1
+                else:
+                    row[4 + CardIndex[CoupGame.deserialize_action(influence['action']).code]] += 1
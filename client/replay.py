@@ -0,0 +1,158 @@
+from collections import Counter
+from typing import List, Tuple
+
+from client.bot_interface import CoupInterface
+from games.Coup.actions import ActionCode, Challenge
+from games.Coup.batch import BatchRecord, CoupBatch
+from games.Coup.coup import CoupGame
+from games.clock import run_virtual
+from games.game_interface import Game
+from games.transport import LocalTransport
+
+CardActions = {action.code: action for action in CoupGame.Actions.values()}
+
+
+def card(code):
+    # Action of a card code, an unknown code gives an action the game rejects
+    return CardActions.get(code, Game.Action)()
+
+
+class ReplayDeck(Game.Deck):
+
+    """Deck that takes the order recorded by a CoupBatch game on each shuffle, instead of a random one."""
+
+    def __init__(self, cards, shuffles):
+        self.shuffles = None  # Random shuffle when the deck is built, the game resets it before dealing
+        self.errors = []
+        super().__init__(cards)
+        self.shuffles = iter(shuffles)
+
+    def shuffle(self):
+        if self.shuffles is None:
+            return super().shuffle()
+        order = next(self.shuffles, None)
+        if order is None:
+            self.errors.append('More shuffles than recorded')
+            return super().shuffle()
+        if Counter(card.code for card in self) != Counter(order):
+            self.errors.append(f'Shuffled {sorted(card.code for card in self)}, recorded {sorted(order)}')
+        self[:] = [card(code) for code in order]
+
+
+class ReplayCoupGame(CoupGame):
+
+    """CoupGame playing the deck and the seats of a recorded CoupBatch game, and comparing the state after each turn."""
+
+    def __init__(self, *args, record: BatchRecord, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.record = record
+        self.shuffle_seats = False  # Seat 0 plays first, like in the batch
+        self.kills = iter(())  # Influences given up during the current turn
+        self.mismatches = []
+
+    @property
+    def decision(self):
+        return self.record.turns[self.turn - 1]
+
+    async def start(self):
+        self.deck = ReplayDeck(self.deck.cards, self.record.shuffles)
+        return await super().start()
+
+    async def _play_turn(self):
+        if self.turn >= len(self.record.turns):
+            self.mismatches.append((self.turn + 1, None, self.state()))
+            self.status = Game.Status.Aborted
+            return
+        self.kills = iter(self.record.turns[self.turn]['kills'])
+        await super()._play_turn()
+
+        expected, actual = self.record.states[self.turn - 1], self.state()
+        if actual != expected or self.deck.errors:
+            self.mismatches.append((self.turn, expected, actual, *self.deck.errors))
+            self.status = Game.Status.Aborted
+
+    def state(self):
+        # Same layout as CoupBatch.state
+        players = list(self.players.values())
+        return {
+            'coins': [player.state.coins for player in players],
+            'cards': [[influence.action.code for influence in player.state.influences] for player in players],
+            'alive_cards': [[influence.alive for influence in player.state.influences] for player in players],
+            'alive': [player.alive for player in players],
+            'deck': [card.code for card in self.deck],
+        }
+
+
+class ReplayBot(CoupInterface):
+
+    """Bot answering with the decisions recorded for its seat."""
+
+    def __init__(self, seat):
+        super().__init__(None)
+        self.seat = seat
+        self.game = None
+
+    async def on_update(self, game_state):
+        pass
+
+    async def on_turn(self):
+        decision = self.game.decision
+        return card(decision['action']), decision['target'] if decision['target'] >= 0 else None
+
+    async def on_action(self, sender, target, action, deadline=None):
+        decision = self.game.decision
+        if decision['reactor'] == self.seat:
+            return card(decision['reaction'])
+
+    async def on_block(self, sender, target, block_with, deadline=None):
+        if self.game.decision['block_challenger'] == self.seat:
+            return Challenge()
+
+    async def on_kill(self):
+        return card(next(self.game.kills))
+
+    async def on_swap(self, target, cards):
+        decision = self.game.decision
+        if decision['action'] == ActionCode.Inquisitor and decision['target'] >= 0:
+            # Inquisitor lookup: the shown card, to replace it
+            return card(decision['shown']) if decision['replace'] else None
+        return [card(code) for code in decision['discard']]
+
+    async def on_lookup(self):
+        return card(self.game.decision['shown'])
+
+
+async def replay(record: BatchRecord, nb_player: int) -> ReplayCoupGame:
+    """Play a recorded game through CoupGame, see ReplayCoupGame.mismatches for the result."""
+    transport = LocalTransport()
+    bots = [ReplayBot(seat) for seat in range(nb_player)]
+    sids = [transport.connect(bot) for bot in bots]
+
+    game = ReplayCoupGame(transport, sids[0], record=record)
+    for sid, bot in zip(sids, bots):
+        bot.game = game
+        transport.enter_room(sid, game.uuid)
+        await game.add_player(sid)
+
+    try:
+        await game.start()
+    finally:
+        for task in transport.tasks:
+            task.cancel()
+    return game
+
+
+def cross_check(batch: CoupBatch) -> List[Tuple]:
+    """Replay every game of a batch played with record=True through CoupGame.
+
+    Return the mismatches as (game, turn, state of the batch, state of CoupGame, errors...), an empty list when both
+    implementations of the rules agree on every turn and on every winner.
+    """
+    mismatches = []
+    for index, record in enumerate(batch.records):
+        game = run_virtual(replay(record, batch.nb_player))
+        mismatches.extend((index, *mismatch) for mismatch in game.mismatches)
+        winner = -1 if game.winner is None else game.winner
+        if not game.mismatches and winner != batch.winner[index]:
+            mismatches.append((index, game.turn, f'winner {batch.winner[index]}', f'winner {winner}'))
+    return mismatches
@@ -0,0 +1,119 @@
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations_with_replacement
+from typing import Dict, List, Optional, Tuple, Type
+
+from client.bot_interface import BotInterface
+from client.util import silent_stdout
+from games.clock import run_virtual
+from games.log import configure_logging
+from games.game_interface import GameInterface
+from games.transport import play_local_game
+
+
+def _init_worker():
+    configure_logging('OFF')
+
+
+async def _play_lineups(game_class: Type[GameInterface], lineups: List[Tuple[Type[BotInterface], ...]]):
+    results = []
+    for lineup in lineups:
+        bots = [bot_class(None) for bot_class in lineup]
+        winner = await play_local_game(game_class, bots, shuffle_seats=False)
+        results.append(bots.index(winner) if winner is not None else None)
+    return results
+
+
+def play_lineups(game_class: Type[GameInterface], lineups, seed=None):
+    """Play one game per lineup on a virtual clock, and return the winning seat of each game (None on a tie).
+
+    The seats are the turn order, the first bot of a lineup plays first.
+    """
+    random.seed(seed)
+    with silent_stdout():
+        return run_virtual(_play_lineups(game_class, lineups))
+
+
+class TournamentResult:
+
+    def __init__(self, nb_player):
+        self.nb_player = nb_player
+        self.nb_game = 0
+        self.ties = 0
+        self.seats = Counter()
+        self.wins = Counter()
+        self.seat_wins = Counter()
+        self.elapsed = 0.0
+
+    def add(self, lineup, winner_seat):
+        self.nb_game += 1
+        self.seats.update(bot.__name__ for bot in lineup)
+        if winner_seat is None:
+            self.ties += 1
+        else:
+            self.wins[lineup[winner_seat].__name__] += 1
+            self.seat_wins[winner_seat] += 1
+
+    @property
+    def games_per_sec(self):
+        return self.nb_game / self.elapsed if self.elapsed else 0.0
+
+    def win_rate(self, bot_name):
+        # Per seat taken, so 1 / nb_player is the expected rate of an average bot
+        return self.wins[bot_name] / self.seats[bot_name] if self.seats[bot_name] else 0.0
+
+    def summary(self):
+        lines = [f'{self.nb_game} games played in {self.elapsed:.2f}s ({self.games_per_sec:.1f} games/sec), '
+                 f'{self.ties} tie(s)']
+        for name in sorted(self.seats, key=self.win_rate, reverse=True):
+            lines.append(f'  {name:<20} win rate {self.win_rate(name):6.1%} '
+                         f'({self.wins[name]} wins over {self.seats[name]} seats)')
+        lines.append('  Wins per seat: ' + ', '.join(f'{seat}: {self.seat_wins[seat]}' for seat in range(self.nb_player)))
+        return '\n'.join(lines)
+
+
+class Tournament:
+
+    """Self-play tournament between bot classes, played on a pool of processes.
+
+    Every lineup of nb_player bots (with repetition) is played in turn, round-robin. Each time a lineup comes back, the
+    bots are rotated by one seat.
+    """
+
+    def __init__(self, game_class: Type[GameInterface], bots: Dict[str, Type[BotInterface]], nb_player: int,
+                 nb_process: Optional[int] = None, chunk_size=50, seed=None):
+        if not game_class.MinPlayer <= nb_player <= game_class.MaxPlayer:
+            raise ValueError(f'{game_class.__name__} is played with {game_class.MinPlayer} to '
+                             f'{game_class.MaxPlayer} players, not {nb_player}')
+        self.game_class = game_class
+        self.nb_player = nb_player
+        self.nb_process = nb_process or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.matches = list(combinations_with_replacement([bots[name] for name in sorted(bots)], nb_player))
+
+    def lineup(self, game_index):
+        match = self.matches[game_index % len(self.matches)]
+        rotation = (game_index // len(self.matches)) % self.nb_player
+        return match[rotation:] + match[:rotation]
+
+    def run(self, nb_game) -> TournamentResult:
+        result = TournamentResult(self.nb_player)
+        lineups = [self.lineup(i) for i in range(nb_game)]
+        chunks = [lineups[i:i + self.chunk_size] for i in range(0, nb_game, self.chunk_size)]
+        seed = random.Random(self.seed)
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(self.nb_process, initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(play_lineups, self.game_class, chunk, seed.getrandbits(32)): chunk for chunk in chunks
+            }
+            for future in as_completed(futures):
+                for lineup, winner_seat in zip(futures[future], future.result()):
+                    result.add(lineup, winner_seat)
+        result.elapsed = time.perf_counter() - start
+
+        return result
@@ -1,11 +1,20 @@
 import importlib
+import os
 import pkgutil
 import inspect
+from contextlib import contextmanager, redirect_stdout
 
 from client import bots
 from client.bot_interface import BotInterface
 
 
+@contextmanager
+def silent_stdout():
+    # The games and the bots print a lot, nobody reads it when many games are played at once
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        yield
+
+
 def iter_namespace(ns_pkg):
     return pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + ".")
 
@@ -25,7 +34,7 @@ def auto_discover_bots():
     discovered_bots = {}
     for name, module in discovered_bot_files.items():
         for bot in extract_bots(module):
-            if issubclass(bot, BotInterface):
+            if issubclass(bot, BotInterface) and not inspect.isabstract(bot):
                 if bot.__name__ in discovered_bots:
                     print(f"WARNING: 2 bots with the same name existed ({bot.__name__} in file {name}).")
                 discovered_bots[bot.__name__] = bot
@@ -1,13 +1,30 @@
 
+from enum import IntEnum
+
 from games.game_interface import Game
 
 
+class ActionCode(IntEnum):
+    # Small integer code of each action, 0 is the generic (hidden) action
+    Hidden = 0
+    Challenge = 1
+    Income = 2
+    ForeignAid = 3
+    Coup = 4
+    Duke = 5
+    Contessa = 6
+    Captain = 7
+    Assassin = 8
+    Ambassador = 9
+    Inquisitor = 10
+
+
 class Challenge(Game.Action):
 
     """This action cannot be played directly"""
 
-    async def validate(self, game, sid, target=None) -> bool:
-        return False
+    __slots__ = ()
+    code = ActionCode.Challenge
 
     async def activate(self, game, sid, target=None):
         pass
@@ -15,47 +32,47 @@ class Challenge(Game.Action):
 
 class Income(Game.Action):
 
-    async def validate(self, game, sid, target=None) -> bool:
-        return game.players[sid].state['coins'] < 10
+    __slots__ = ()
+    code = ActionCode.Income
 
     async def activate(self, game, sid, target=None):
-        game.players[sid].state['coins'] += 1
+        game.players[sid].state.coins += 1
 
 
 class ForeignAid(Game.Action):
 
-    async def validate(self, game, sid, target=None) -> bool:
-        return game.players[sid].state['coins'] < 10
+    __slots__ = ()
+    code = ActionCode.ForeignAid
 
     async def activate(self, game, sid, target=None):
-        game.players[sid].state['coins'] += 2
+        game.players[sid].state.coins += 2
 
 
 class Coup(Game.Action):
 
-    async def validate(self, game, sid, target=None) -> bool:
-        return game.players[sid].state['coins'] >= 7 and target is not None and sid != target
+    __slots__ = ()
+    code = ActionCode.Coup
 
     async def activate(self, game, sid, target=None):
-        game.players[sid].state['coins'] -= 7
+        game.players[sid].state.coins -= 7
         await game.kill(target)
 
 
 class Duke(Game.Action):
 
-    async def validate(self, game, sid, target=None):
-        return game.players[sid].state['coins'] < 10
+    __slots__ = ()
+    code = ActionCode.Duke
 
     async def activate(self, game, sid, target=None):
-        game.players[sid].state['coins'] += 3
+        game.players[sid].state.coins += 3
 
 
 class Contessa(Game.Action):
 
     """This action cannot be played directly"""
 
-    async def validate(self, game, sid, target=None) -> bool:
-        return False
+    __slots__ = ()
+    code = ActionCode.Contessa
 
     async def activate(self, game, sid, target=None):
         pass
@@ -63,29 +80,29 @@ class Contessa(Game.Action):
 
 class Captain(Game.Action):
 
-    async def validate(self, game, sid, target=None):
-        return game.players[sid].state['coins'] < 10 and target is not None and sid != target
+    __slots__ = ()
+    code = ActionCode.Captain
 
     async def activate(self, game, sid, target=None):
-        amount = min(2, game.players[target].state['coins'])
-        game.players[target].state['coins'] -= amount
-        game.players[sid].state['coins'] += amount
+        amount = min(2, game.players[target].state.coins)
+        game.players[target].state.coins -= amount
+        game.players[sid].state.coins += amount
 
 
 class Assassin(Game.Action):
 
-    async def validate(self, game, sid, target=None):
-        return 3 <= game.players[sid].state['coins'] < 10 and target is not None and sid != target
+    __slots__ = ()
+    code = ActionCode.Assassin
 
     async def activate(self, game, sid, target=None):
-        game.players[sid].state['coins'] -= 3
+        game.players[sid].state.coins -= 3
         await game.kill(target)
 
 
 class Ambassador(Game.Action):
 
-    async def validate(self, game, sid, target=None):
-        return True
+    __slots__ = ()
+    code = ActionCode.Ambassador
 
     async def activate(self, game, sid, target=None):
         await game.swap(sid, 2)
@@ -93,8 +110,8 @@ class Ambassador(Game.Action):
 
 class Inquisitor(Game.Action):
 
-    async def validate(self, game, sid, target=None):
-        return True
+    __slots__ = ()
+    code = ActionCode.Inquisitor
 
     async def activate(self, game, sid, target=None):
         if target is None:
@@ -0,0 +1,433 @@
+from typing import List, Optional
+
+import numpy as np
+
+from games.Coup import legal
+from games.Coup.actions import ActionCode, Captain
+from games.Coup.legal import Answer, MaxCoins, NoTarget, TurnActions, turn_moves
+
+Cards = (ActionCode.Duke, ActionCode.Contessa, ActionCode.Captain, ActionCode.Assassin, ActionCode.Ambassador,
+         ActionCode.Inquisitor)
+CardCopies = 3
+DeckSize = len(Cards) * CardCopies
+
+# Actions without reaction window, the cards blocking the Captain, and the outcome of each (action, answer)
+Unanswerable = tuple(action.code for action in legal.Unanswerable)
+CaptainBlocks = tuple(block.code for block in legal.Blocks[Captain])
+AnswerTable = np.array(legal.AnswerTable, dtype=np.int8)
+Targeted = (ActionCode.Coup, ActionCode.Captain, ActionCode.Assassin)
+
+
+def _turn_rules():
+    # From the legal moves of a turn with the player 0 alive: the bit of no target, and the bit of the player 0
+    untargeted = np.zeros((MaxCoins + 1, len(ActionCode)), dtype=bool)
+    targeted = np.zeros((MaxCoins + 1, len(ActionCode)), dtype=bool)
+    for coins in range(MaxCoins + 1):
+        for action, targets in zip(TurnActions, turn_moves(coins, (0,))):
+            untargeted[coins, action.code] = targets & NoTarget
+            targeted[coins, action.code] = targets >> 1 & 1
+    return untargeted, targeted
+
+
+# Actions the current player may play without target, and on another player alive, by coins and ActionCode
+UntargetedActions, TargetedActions = _turn_rules()
+LegalActions = UntargetedActions | TargetedActions
+
+
+class BatchRecord:
+
+    """Everything needed to replay one game of a batch through CoupGame, see client.replay."""
+
+    def __init__(self):
+        self.shuffles = []  # Content of the deck after each shuffle, from the bottom to the top
+        self.turns = []  # Decisions of the players for each turn
+        self.states = []  # State of the game after each turn
+
+
+class CoupBatch:
+
+    """Play nb_game games of Coup in lockstep, with the rules of CoupGame, as NumPy arrays over a game axis.
+
+    Players are seats 0 to nb_player - 1, seat 0 plays first and the turns follow the seats. Influences are card codes
+    (ActionCode) in two slots per player. The deck is a stack per game, its top is at deck_size - 1.
+
+    Each call to step plays one turn of every game still running. Each decision is an array over the games, see step.
+    With record=True, the decisions, the shuffles and the states are recorded to cross-check the rules with CoupGame.
+    """
+
+    def __init__(self, nb_game: int, nb_player: int, seed=None, record=False):
+        self.nb_game = nb_game
+        self.nb_player = nb_player
+        self.rng = np.random.default_rng(seed)
+        self.record = record
+        self.records: Optional[List[BatchRecord]] = [BatchRecord() for _ in range(nb_game)] if record else None
+
+        self.coins = np.full((nb_game, nb_player), 2, dtype=np.int32)
+        self.cards = np.zeros((nb_game, nb_player, 2), dtype=np.int8)
+        self.alive_cards = np.ones((nb_game, nb_player, 2), dtype=bool)
+        self.alive = np.ones((nb_game, nb_player), dtype=bool)
+        self.deck = np.tile(np.repeat(np.array(Cards, dtype=np.int8), CardCopies), (nb_game, 1))
+        self.deck_size = np.full(nb_game, DeckSize, dtype=np.int32)
+        self.turn = np.zeros(nb_game, dtype=np.int32)
+        self.winner = np.full(nb_game, -1, dtype=np.int32)
+        self.done = np.zeros(nb_game, dtype=bool)
+        self.current = np.full(nb_game, -1, dtype=np.int32)
+
+        games = np.arange(nb_game)
+        self._shuffle(games)
+        for seat in range(nb_player):
+            seats = np.full(nb_game, seat)
+            for slot in range(2):
+                self.cards[games, seats, slot] = self._pop(games)
+        self._next_player()
+
+    # Deck
+
+    def _shuffle(self, games):
+        if not len(games):
+            return
+        keys = self.rng.random((len(games), DeckSize))
+        keys[np.arange(DeckSize) >= self.deck_size[games, None]] = 2.0  # The empty part of the stack does not move
+        order = np.argsort(keys, axis=1)
+        self.deck[games] = np.take_along_axis(self.deck[games], order, axis=1)
+        if self.record:
+            for game in games:
+                self.records[game].shuffles.append(self.deck[game, :self.deck_size[game]].tolist())
+
+    def _push(self, games, cards):
+        self.deck[games, self.deck_size[games]] = cards
+        self.deck_size[games] += 1
+
+    def _pop(self, games):
+        self.deck_size[games] -= 1
+        return self.deck[games, self.deck_size[games]]
+
+    # Rules, each one applied to the games given as an array of indices
+
+    def _eliminate(self, games, seats):
+        self.alive[games, seats] = False
+        self.alive_cards[games, seats] = False
+
+    def _first_alive(self, games, seats, cards):
+        # Slot of the first alive influence of each player with the given card, -1 if there is none
+        match = self.alive_cards[games, seats] & (self.cards[games, seats] == np.asarray(cards)[:, None])
+        return np.where(match.any(axis=1), match.argmax(axis=1), -1)
+
+    def _replace(self, games, seats, cards):
+        # The revealed influence goes back to the deck, and is replaced by the top card after a shuffle
+        slots = self._first_alive(games, seats, cards)
+        self._push(games, cards)
+        self._shuffle(games)
+        self.cards[games, seats, slots] = self._pop(games)
+
+    def _kill(self, games, seats, kill_slot):
+        nb_alive = self.alive_cards[games, seats].sum(axis=1)
+
+        # The player chooses the influence to give up, a card that is not alive eliminates the player
+        ask = nb_alive > 1
+        games_asked, seats_asked = games[ask], seats[ask]
+        slots = kill_slot[games_asked, seats_asked]
+        valid = (slots >= 0) & (slots < 2)
+        named = np.where(valid, self.cards[games_asked, seats_asked, np.clip(slots, 0, 1)], -1)
+        if self.record:
+            for game, card in zip(games_asked, named):
+                self.records[game].turns[-1]['kills'].append(int(card) if card >= 0 else None)
+        lost = self._first_alive(games_asked, seats_asked, named)
+        chosen = lost >= 0
+        self.alive_cards[games_asked[chosen], seats_asked[chosen], lost[chosen]] = False
+        self._eliminate(games_asked[~chosen], seats_asked[~chosen])
+
+        last = nb_alive == 1
+        self._eliminate(games[last], seats[last])
+
+    def _challenge(self, games, challengers, targets, cards, kill_slot):
+        # True when the target has the card. Like in CoupGame, the loser of the challenge loses an influence.
+        won = self._first_alive(games, targets, cards) >= 0
+        self._replace(games[won], targets[won], cards[won])
+        self._kill(games[won], challengers[won], kill_slot)
+        self._kill(games[~won], targets[~won], kill_slot)
+        return won
+
+    def _swap(self, games, seats, count, discard):
+        drawn = np.stack([self._pop(games) for _ in range(count)], axis=1) if len(games) else \
+            np.zeros((0, count), dtype=np.int8)
+
+        # The alive influences then the drawn cards, as offered by CoupGame.swap
+        alive_cards = self.alive_cards[games, seats]
+        nb_alive = alive_cards.sum(axis=1)
+        candidates = np.full((len(games), 2 + count), -1, dtype=np.int8)
+        position = np.zeros(len(games), dtype=np.int64)
+        rows = np.arange(len(games))
+        for slot in range(2):
+            has = alive_cards[:, slot]
+            candidates[rows[has], position[has]] = self.cards[games[has], seats[has], slot]
+            position += has
+        for i in range(count):
+            candidates[rows, position + i] = drawn[:, i]
+
+        # Discarded cards are matched by card, like CoupGame does, each candidate at most once
+        indices = discard[games]
+        given = indices >= 0
+        valid = given.sum(axis=1) == count
+        named = np.where(given & (indices < (nb_alive + count)[:, None]),
+                         np.take_along_axis(candidates, np.clip(indices, 0, 1 + count), axis=1), -1)
+        matched = np.zeros_like(candidates, dtype=bool)
+        for i in range(discard.shape[1]):
+            hit = (candidates == named[:, i, None]) & ~matched & (named[:, i, None] >= 0) & given[:, i, None]
+            found = hit.any(axis=1)
+            valid &= found | ~given[:, i]
+            matched[rows[found], hit.argmax(axis=1)[found]] = True
+        if self.record:
+            for game, cards, is_given in zip(games, named, given):
+                self.records[game].turns[-1]['discard'] = [int(card) if card >= 0 else int(ActionCode.Challenge)
+                                                           for card, g in zip(cards, is_given) if g]
+
+        invalid = ~valid
+        self._eliminate(games[invalid], seats[invalid])
+        for i in range(count):
+            self._push(games[invalid], drawn[invalid, i])
+
+        for i in range(2 + count):
+            back = valid & matched[:, i]
+            self._push(games[back], candidates[back, i])
+        self._shuffle(games)
+
+        # Dead influences first, then the kept cards in the order of the candidates
+        games, seats, candidates, matched = games[valid], seats[valid], candidates[valid], matched[valid]
+        alive_cards = self.alive_cards[games, seats]
+        dead_cards = np.where(alive_cards, -1, self.cards[games, seats])
+        kept = np.where(matched | (candidates < 0), -1, candidates)
+        ordered = np.concatenate([dead_cards, kept], axis=1)
+        order = np.argsort(ordered < 0, axis=1, kind='stable')[:, :2]
+        new_cards = np.take_along_axis(ordered, order, axis=1)
+        nb_dead = (~alive_cards).sum(axis=1)
+        self.cards[games, seats] = new_cards
+        self.alive_cards[games, seats] = np.arange(2) >= nb_dead[:, None]
+
+    def _lookup(self, games, seats, targets, shown_slot, replace):
+        alive = self.alive[games, targets]
+        games, seats, targets = games[alive], seats[alive], targets[alive]
+
+        slots = shown_slot[games]
+        valid = (slots >= 0) & (slots < 2)
+        shown = np.where(valid, self.cards[games, targets, np.clip(slots, 0, 1)], -1)
+        valid &= self._first_alive(games, targets, shown) >= 0
+        if self.record:
+            for game, card in zip(games, shown):
+                self.records[game].turns[-1]['shown'] = int(card) if card >= 0 else None
+        self._eliminate(games[~valid], targets[~valid])
+
+        replaced = valid & replace[games]
+        self._replace(games[replaced], targets[replaced], shown[replaced])
+
+    def _next_player(self):
+        nb_alive = self.alive.sum(axis=1)
+        finished = ~self.done & (nb_alive < 2)
+        self.winner[finished] = np.where(nb_alive[finished] == 1, self.alive[finished].argmax(axis=1), -1)
+        self.done |= finished
+
+        # The next alive seat after the current player
+        seats = (self.current[:, None] + 1 + np.arange(self.nb_player)) % self.nb_player
+        first = np.take_along_axis(self.alive, seats, axis=1).argmax(axis=1)
+        self.current = np.where(self.done, -1, seats[np.arange(self.nb_game), first])
+
+    # Public interface
+
+    def legal_actions(self):
+        """Mask (nb_game, 11) of the actions the current player may play, indexed by ActionCode, bluffs included."""
+        games = np.arange(self.nb_game)
+        coins = self.coins[games, np.maximum(self.current, 0)]
+        mask = LegalActions[np.minimum(coins, MaxCoins)]
+        mask[self.done] = False
+        return mask
+
+    def step(self, action, target=None, reactor=None, reaction=None, block_challenger=None, kill_slot=None,
+             discard=None, shown_slot=None, replace=None):
+        """Play one turn of the running games. Every argument is an array over the games, ignored for finished games.
+
+        action: ActionCode played by the current player
+        target: seat targeted by the action, -1 for none
+        reactor: seat answering the action, -1 when every player lets it go
+        reaction: ActionCode of the answer of reactor, Challenge or the card used to block
+        block_challenger: seat challenging the block, -1 for none
+        kill_slot: (nb_game, nb_player) slot given up by each seat when it loses an influence
+        discard: (nb_game, 2) cards given back on a swap, as indices in the alive influences then the drawn cards,
+            -1 when unused
+        shown_slot: slot shown by the target of an Inquisitor lookup
+        replace: whether the Inquisitor replaces the shown card
+        """
+        nb_game, nb_player = self.nb_game, self.nb_player
+        none = np.full(nb_game, -1, dtype=np.int32)
+        action = np.asarray(action, dtype=np.int32)
+        target = none if target is None else np.asarray(target, dtype=np.int32)
+        reactor = none if reactor is None else np.asarray(reactor, dtype=np.int32)
+        reaction = none if reaction is None else np.asarray(reaction, dtype=np.int32)
+        block_challenger = none if block_challenger is None else np.asarray(block_challenger, dtype=np.int32)
+        kill_slot = np.zeros((nb_game, nb_player), dtype=np.int32) if kill_slot is None else np.asarray(kill_slot)
+        if discard is None:
+            # The first candidates, a single one for the Inquisitor
+            discard = np.tile(np.array([0, 1]), (nb_game, 1))
+            discard[action == ActionCode.Inquisitor, 1] = -1
+        discard = np.asarray(discard)
+        shown_slot = np.zeros(nb_game, dtype=np.int32) if shown_slot is None else np.asarray(shown_slot)
+        replace = np.zeros(nb_game, dtype=bool) if replace is None else np.asarray(replace, dtype=bool)
+
+        games = np.nonzero(~self.done)[0]
+        current = self.current[games]
+        self.turn[games] += 1
+        if self.record:
+            for game in games:
+                self.records[game].turns.append({
+                    'action': int(action[game]), 'target': int(target[game]), 'reactor': int(reactor[game]),
+                    'reaction': int(reaction[game]), 'block_challenger': int(block_challenger[game]),
+                    'replace': bool(replace[game]), 'kills': [],
+                })
+
+        # Validation, an invalid turn eliminates the current player
+        act, tgt = action[games], target[games]
+        has_target = tgt >= 0
+        coins = np.minimum(self.coins[games, current], MaxCoins)
+        code = np.clip(act, 0, len(ActionCode) - 1)
+        other_target = has_target & (tgt < nb_player) & (tgt != current)
+        other_target &= self.alive[games, np.clip(tgt, 0, nb_player - 1)]
+        valid = (act == code) & np.where(has_target, TargetedActions[coins, code] & other_target,
+                                         UntargetedActions[coins, code])
+        self._eliminate(games[~valid], current[~valid])
+        games, current, act, tgt, has_target = games[valid], current[valid], act[valid], tgt[valid], has_target[valid]
+
+        # Reaction to the action. An invalid answer eliminates the player who gave it.
+        who, answer = reactor[games], reaction[games]
+        answered = ~np.isin(act, Unanswerable) & (who >= 0) & (who < nb_player) & (who != current)
+        answered &= self.alive[games, np.clip(who, 0, nb_player - 1)]
+        known = (answer >= 0) & (answer < len(ActionCode))
+        kind = np.where(known, AnswerTable[act, np.clip(answer, 0, len(ActionCode) - 1)], Answer.Invalid)
+        challenge = answered & (kind == Answer.Challenge)
+        block = answered & ((kind == Answer.Block) | (kind == Answer.TargetBlock) & (who == tgt))
+        invalid = answered & ~challenge & ~block
+        self._eliminate(games[invalid], who[invalid])
+
+        blocked = np.zeros(len(games), dtype=bool)
+        won = self._challenge(games[challenge], who[challenge], current[challenge], act[challenge], kill_slot)
+        blocked[challenge] = ~won
+
+        # Reaction to the block, only a challenge is expected
+        blocked[block] = True
+        contest = block & (block_challenger[games] >= 0) & (block_challenger[games] < nb_player)
+        contest &= block_challenger[games] != who
+        contest &= self.alive[games, np.clip(block_challenger[games], 0, nb_player - 1)]
+        held = self._challenge(games[contest], block_challenger[games][contest], who[contest], answer[contest],
+                               kill_slot)
+        blocked[contest] = held
+
+        # Activation
+        go = ~blocked
+        games, current, act, tgt, has_target = games[go], current[go], act[go], tgt[go], has_target[go]
+        for code, amount in ((ActionCode.Income, 1), (ActionCode.ForeignAid, 2), (ActionCode.Duke, 3)):
+            played = act == code
+            self.coins[games[played], current[played]] += amount
+
+        played = act == ActionCode.Captain
+        stolen = np.minimum(2, self.coins[games[played], tgt[played]])
+        self.coins[games[played], tgt[played]] -= stolen
+        self.coins[games[played], current[played]] += stolen
+
+        for code, cost in ((ActionCode.Coup, 7), (ActionCode.Assassin, 3)):
+            played = act == code
+            self.coins[games[played], current[played]] -= cost
+            self._kill(games[played], tgt[played], kill_slot)
+
+        played = act == ActionCode.Ambassador
+        self._swap(games[played], current[played], 2, discard)
+        played = (act == ActionCode.Inquisitor) & ~has_target
+        self._swap(games[played], current[played], 1, discard)
+        played = (act == ActionCode.Inquisitor) & has_target
+        self._lookup(games[played], current[played], tgt[played], shown_slot, replace)
+
+        if self.record:
+            for game in np.nonzero(self.turn > 0)[0]:
+                record = self.records[game]
+                if len(record.states) < len(record.turns):
+                    record.states.append(self.state(game))
+
+        self._next_player()
+
+    def state(self, game):
+        # Plain python state of a game, as compared with CoupGame
+        return {
+            'coins': self.coins[game].tolist(),
+            'cards': self.cards[game].tolist(),
+            'alive_cards': self.alive_cards[game].tolist(),
+            'alive': self.alive[game].tolist(),
+            'deck': self.deck[game, :self.deck_size[game]].tolist(),
+        }
+
+    def random_decisions(self, bluff=0.5, reaction=0.3, mistake=0.01):
+        """Random decisions for every game, mostly legal. Blocks and challenges are answered with a probability of
+        reaction, bluffs are played with a probability of bluff, and a few mistakes exercise the eliminations."""
+        rng, nb_game, nb_player = self.rng, self.nb_game, self.nb_player
+        games = np.arange(nb_game)
+        current = np.maximum(self.current, 0)
+
+        def pick(mask):
+            # Random index of a True value of each row, -1 for a row without any
+            keys = np.where(mask, rng.random(mask.shape), -1.0)
+            return np.where(mask.any(axis=1), keys.argmax(axis=1), -1)
+
+        has_card = np.zeros((nb_game, len(ActionCode)), dtype=bool)
+        for slot in range(2):
+            alive = self.alive_cards[games, current, slot]
+            has_card[games[alive], self.cards[games, current, slot][alive]] = True
+        legal = self.legal_actions()
+        honest = legal & (has_card | ~np.isin(np.arange(len(ActionCode)), Cards))
+        legal = np.where((rng.random(nb_game) < bluff)[:, None] | ~honest.any(axis=1)[:, None], legal, honest)
+        action = pick(legal)
+
+        others = self.alive & (np.arange(nb_player) != current[:, None])
+        target = np.where(np.isin(action, Targeted) | ((action == ActionCode.Inquisitor) & (rng.random(nb_game) < .5)),
+                          pick(others), -1)
+
+        reactor = np.where(rng.random(nb_game) < reaction, pick(others), -1)
+        blocker_card = np.select(
+            [action == ActionCode.ForeignAid, action == ActionCode.Assassin, action == ActionCode.Captain],
+            [ActionCode.Duke, ActionCode.Contessa, rng.choice(CaptainBlocks, nb_game)], -1)
+        can_block = (blocker_card >= 0) & ((action == ActionCode.ForeignAid) | (reactor == target))
+        can_challenge = AnswerTable[action, ActionCode.Challenge] == Answer.Challenge
+        reaction_code = np.where(can_block & (~can_challenge | (rng.random(nb_game) < .5)), blocker_card,
+                                 ActionCode.Challenge)
+        reactor = np.where(can_block | can_challenge, reactor, -1)
+
+        block_challenger = np.where(rng.random(nb_game) < reaction,
+                                    pick(self.alive & (np.arange(nb_player) != reactor[:, None])), -1)
+
+        # A kill only asks players with two influences
+        kill_slot = rng.integers(0, 2, (nb_game, nb_player))
+
+        # Distinct cards among the alive influences and the drawn cards
+        drawn = np.where(action == ActionCode.Inquisitor, 1, 2)
+        nb_candidate = self.alive_cards[games, current].sum(axis=1) + drawn
+        keys = rng.random((nb_game, 4))
+        keys[np.arange(4) >= nb_candidate[:, None]] = 2.0
+        discard = np.argsort(keys, axis=1)[:, :2]
+        discard[:, 1] = np.where(drawn == 1, -1, discard[:, 1])
+        shown_slot = pick(self.alive_cards[games, np.maximum(target, 0)])
+        replace = rng.random(nb_game) < .5
+
+        oops = rng.random(nb_game) < mistake
+        action = np.where(oops & (rng.random(nb_game) < .5), ActionCode.Contessa, action)
+        reaction_code = np.where(oops & (rng.random(nb_game) < .5), ActionCode.Income, reaction_code)
+        kill_slot = np.where(oops[:, None] & (rng.random((nb_game, nb_player)) < .5), 2, kill_slot)
+        discard[:, 0] = np.where(oops & (rng.random(nb_game) < .5), 4, discard[:, 0])
+
+        return {
+            'action': action, 'target': target, 'reactor': reactor, 'reaction': reaction_code,
+            'block_challenger': block_challenger, 'kill_slot': kill_slot, 'discard': discard,
+            'shown_slot': shown_slot, 'replace': replace,
+        }
+
+    def run(self, max_turns=1000):
+        """Play every game to the end with random decisions, and return the winner of each game (-1 on a tie)."""
+        for _ in range(max_turns):
+            if self.done.all():
+                break
+            self.step(**self.random_decisions())
+        return self.winner
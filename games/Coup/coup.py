@@ -1,34 +1,47 @@
 import asyncio
 import functools
 import random
+import time
 from enum import Enum
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 from socketio import exceptions
 
 from games.Coup.actions import Income, ForeignAid, Coup, Duke, Contessa, Captain, Assassin, Ambassador, Challenge, \
     Inquisitor
+from games.Coup import legal
 from games.game_interface import GameInterface, Game
+from games.transport import to_wire
 
 
-class Influence(dict):
+class Influence:
 
-    def __init__(self, action: Game.Action):
-        super().__init__()
-        self['action'] = action
-        self['alive'] = True
+    __slots__ = ('action', 'alive')
 
-    @property
-    def action(self):
-        return self['action']
+    def __init__(self, action: Game.Action, alive=True):
+        self.action = action
+        self.alive = alive
 
-    @property
-    def alive(self):
-        return self['alive']
+    def copy(self):
+        return Influence(self.action, self.alive)
+
+    def to_wire(self):
+        return {'action': self.action.to_wire(), 'alive': self.alive}
+
+
+class PlayerState(Game.State):
+
+    __slots__ = ('coins', 'influences')
 
-    @alive.setter
-    def alive(self, value: bool):
-        self['alive'] = value
+    def __init__(self, coins=0, influences: List[Influence] = None):
+        self.coins = coins
+        self.influences = influences or []
+
+    def fingerprint(self):
+        return self.coins, tuple((influence.action.code, influence.alive) for influence in self.influences)
+
+    def copy(self):
+        return PlayerState(self.coins, [influence.copy() for influence in self.influences])
 
 
 class CoupGame(GameInterface):
@@ -59,9 +72,9 @@ class CoupGame(GameInterface):
             cards.extend(action() for _ in range(3))
         self.deck = Game.Deck(cards)
         self.blocked_action = False
-        self.is_resolved = asyncio.Event()
+        self.resolution = None  # Future done when the current reaction window is closed
         self.reaction_lock = asyncio.Lock()
-        self.has_answer = None
+        self.answers = {}
         self.challenger = None
         self.blocker = None
 
@@ -78,76 +91,88 @@ class CoupGame(GameInterface):
         else:
             return val
 
+    def legal_moves(self, sid):
+        targets = (player.pid for other, player in self.players.items() if player.alive and other != sid)
+        return legal.turn_moves(self.players[sid].state.coins, targets)
+
+    def is_legal_move(self, moves, action, target_pid):
+        return legal.is_legal(moves, action, target_pid)
+
     async def start(self):
         self.deck.reset()
-        self.is_resolved.set()
         for p in self.players:
             self.players[p].obfuscator = self.player_obfuscator
-            self.players[p].state['coins'] = 2
-            self.players[p].state['influences'] = [Influence(card) for card in self.deck.take(2)]
-        await super().start()
+            self.players[p].state = PlayerState(2, [Influence(card) for card in self.deck.take(2)])
+        return await super().start()
 
     async def next_turn(self, action, target_pid):
         self.blocked_action = False
         self.challenger = None
         self.blocker = None
 
-        print('-------------------------------------------------')
+        self.logger.debug('Turn %s', self.turn)
 
         if target_pid is not None:
-            print(f'Player {self.current_player.pid} tried to use {self.current_action} on player {target_pid}')
+            self.logger.info('Player %s tried to use %s on player %s', self.current_player.pid, self.current_action, target_pid)
         else:
-            print(f'Player {self.current_player.pid} tried to use {self.current_action}')
+            self.logger.info('Player %s tried to use %s', self.current_player.pid, self.current_action)
 
         target = self.pid_to_sid(target_pid)
 
-        await self.send_action(self.current_player.sid, target, action=self.current_action)
+        with self.phase('reactions', event=CoupGame.Event.Action.value):
+            await self.send_action(self.current_player.sid, target, action=self.current_action)
 
         if self.challenger:
             # The first reaction was a challenge
-            self.blocked_action = not await self.challenge(self.challenger, self.current_player.sid, self.current_action)
+            with self.phase('challenge'):
+                self.blocked_action = not await self.challenge(self.challenger, self.current_player.sid, self.current_action)
 
         elif self.blocker:
             # The first reaction was a block
             self.blocked_action = True
-            print(f'Player {self.players[self.blocker[0]].pid} tried to block player {self.current_player.pid} with {self.blocker[1]}')
+            self.logger.info('Player %s tried to block player %s with %s', self.players[self.blocker[0]].pid,
+                             self.current_player.pid, self.blocker[1])
 
-            await self.send_action(self.blocker[0], self.current_player.sid, action=self.blocker[1], is_block=True)
+            with self.phase('reactions', event=CoupGame.Event.Block.value):
+                await self.send_action(self.blocker[0], self.current_player.sid, action=self.blocker[1], is_block=True)
 
             if self.challenger:
-                self.blocked_action = await self.challenge(self.challenger, self.blocker[0], self.blocker[1])
+                with self.phase('challenge'):
+                    self.blocked_action = await self.challenge(self.challenger, self.blocker[0], self.blocker[1])
             else:
-                print('Nobody challenged the block')
+                self.logger.debug('Nobody challenged the block')
         if self.blocked_action:
-            print(f'Player {self.current_player.pid} action {self.current_action} was blocked.')
             # print(f'Current player state: {self.current_player.state}. '
             #       f'Target player state: {self.players[target].state if target else None}')
-            await self.sio.send(f'Player {self.current_player.pid} action {self.current_action} was blocked.', room=self.uuid)
+            self.log('Player %s action %s was blocked.', self.current_player.pid, self.current_action)
         else:
 
             try:
-                print(f'Player {self.current_player.pid} action {self.current_action} is activated')
-                await self.sio.send(f'Player {self.current_player.pid} action {self.current_action} is activated.', room=self.uuid)
-                await self.current_action.activate(self, self.current_player.sid, self.pid_to_sid(target_pid))
+                self.log('Player %s action %s is activated.', self.current_player.pid, self.current_action)
+                with self.phase('activate', action=str(self.current_action)):
+                    await self.current_action.activate(self, self.current_player.sid, self.pid_to_sid(target_pid))
                 # print(f'Current player state: {self.current_player.state}. '
                 #       f'Target player state: {self.players[target].state if target else None}')
             except Exception as ex:
-                print(ex)
+                self.logger.warning(ex)
                 await self.sio.send('An error happened in card activation', to=self.current_player.sid)
 
     async def send_action(self, sender, target, action: Game.Action, is_block=False):
 
+        loop = asyncio.get_event_loop()
         target_pid = self.players[target].pid if target else None
         sender_pid = self.players[sender].pid
-        self.has_answer = {sid: False for sid in self.alive_players if sid != sender}
+        self.answers = {sid: loop.create_future() for sid in self.alive_players if sid != sender}
+
+        # Every player shares the same reaction window. The deadline is a wall clock timestamp for the players.
+        timeout = self.timeout(*self.answers)
+        sent_at = loop.time()
+        deadline = time.time() + timeout
+        data = (*to_wire((sender_pid, target_pid, action)), deadline)
 
         # Optimization: No reaction for those action
-        if type(action) in {Coup, Income}:
-            await self.sio.emit(
-                self.Event.Action.value,
-                data=(sender_pid, target_pid, action),
-                to=self.uuid
-            )
+        if type(action) in legal.Unanswerable:
+            await self.sio.emit(self.Event.Action.value, data=data, to=self.uuid)
             return
 
         players_to_send = list(self.players.keys())
@@ -155,108 +180,111 @@ class CoupGame(GameInterface):
 
         event = CoupGame.Event.Block.value if is_block else CoupGame.Event.Action.value
 
-        self.is_resolved.clear()
-        for sid in players_to_send:
-            if self.players[sender].sid == sid or not self.players[sid].alive:
-                await self.sio.emit(
-                    event,
-                    data=(sender_pid, target_pid, action),
-                    to=sid
-                )
-            else:
-                await self.sio.emit(
-                    event,
-                    data=(sender_pid, target_pid, action),
-                    to=sid,
-                    # This is a workaround the callback that does not contains the client socket id
-                    callback=functools.partial(self._reaction_handler, sid, target, action)
-                )
+        self.resolution = loop.create_future()
+        if not self.answers:
+            self.resolve()
+        await asyncio.gather(*(
+            self.sio.emit(event, data=data, to=sid)
+            if sid not in self.answers else
+            self.sio.emit(
+                event,
+                data=data,
+                to=sid,
+                # This is a workaround the callback that does not contains the client socket id
+                callback=functools.partial(self._reaction_handler, self.answers[sid], event, sent_at, sid, target, action)
+            )
+            for sid in players_to_send
+        ))
 
-        try:
-            await asyncio.wait_for(self.is_resolved.wait(), timeout=self.ActionTimeout)
-        except asyncio.TimeoutError:
-            print('Reaction has timeout')
-        finally:
-            if any(not answer for answer in self.has_answer.values()):
-                await asyncio.sleep(0.05)  # make sure every player has answer has been process
-                async with self.reaction_lock:
-                    for sid, has_answer in self.has_answer.items():
-                        if not has_answer:
-                            await self.eliminate(sid, reason='Timed out during action event')
-            print('==== Reaction is resolved ====')
-
-    async def _reaction_handler(self, sid, target, current_action: Game.Action, answer: Optional[Dict] = None):
-        self.has_answer[sid] = True
+        # Closed by a decisive answer (challenge or block), by the last answer or by the deadline
+        await asyncio.wait((self.resolution,), timeout=sent_at + timeout - loop.time())
+
+        self.metrics.reaction_windows.observe(loop.time() - sent_at, event=event)
+        timed_out = not self.resolution.done()
+        if timed_out:
+            self.logger.debug('Reaction has timeout')
+        async with self.reaction_lock:
+            self.resolve()
+            for sid, answered in self.answers.items():
+                if not answered.done():
+                    answered.cancel()  # Any late answer is ignored
+                    if timed_out:
+                        self.metrics.timeouts.inc(event=event)
+                        await self.eliminate(sid, reason='Timed out during action event')
+        self.logger.debug('==== Reaction is resolved ====')
+
+    def resolve(self):
+        if not self.resolution.done():
+            self.resolution.set_result(None)
+
+    async def _reaction_handler(self, answered: asyncio.Future, event, sent_at, sid, target,
+                                current_action: Game.Action, answer: Optional[Dict] = None):
+        if answered.done():
+            return  # The reaction window is already closed
+        elapsed = asyncio.get_event_loop().time() - sent_at
+        self.record_rtt(event, sid, elapsed)
+        if self.trace is not None:
+            now = time.perf_counter()
+            self.trace.add(event, now - elapsed, now, self.players[sid].pid)
         # print(f'Received answer {answer["type"] if answer else None} from player {self.players[sid].pid}')
         async with self.reaction_lock:
-            if answer is not None and not self.is_resolved.is_set():
+            if answered.done():
+                return
+            if answer is not None and not self.resolution.done():
 
                 answer = self.deserialize_action(answer)
 
                 if answer is None:
                     await self.eliminate(sid, reason='Invalid response')
 
-                elif type(answer) is Challenge:
-                    if type(current_action) in {Income, ForeignAid, Coup}:  # Non-Challengeable action
-                        await self.eliminate(sid, reason=f'Tried to challenge a {current_action}')
-                    else:
-                        self.challenger = sid
-                        self.is_resolved.set()
-
-                elif type(answer) in {Captain, Duke, Contessa, Inquisitor, Ambassador}:
-                    if self.challenger is not None:  # Cannot have a block after a challenge
-                        print(f'Late block by player {self.players[sid].pid}. Action already challenged by {self.players[self.challenger].pid}')
-                    elif self.blocker is not None:
-                        print(f'Action already blocked by {self.players[self.blocker[0]].pid}')
-                    elif type(current_action) is Captain and type(answer) is Captain:
-                        if sid == target:
-                            self.blocker = (sid, answer)
-                        else:
-                            await self.eliminate(sid, reason='Cannot block the Captain for someone else')
-                    elif type(current_action) is Captain and type(answer) is Ambassador:
-                        if sid == target:
-                            self.blocker = (sid, answer)
-                        else:
-                            await self.eliminate(sid, reason='Cannot block the Captain for someone else')
-                    elif type(current_action) is Captain and type(answer) is Inquisitor:
-                        if sid == target:
-                            self.blocker = (sid, answer)
-                        else:
-                            await self.eliminate(sid, reason='Cannot block the Captain for someone else')
-                    elif type(current_action) is ForeignAid and type(answer) is Duke:
-                        self.blocker = (sid, answer)
-                    elif type(current_action) is Assassin and type(answer) is Contessa:
-                        if sid == target:
-                            self.blocker = (sid, answer)
-                        else:
-                            await self.eliminate(sid, reason='Cannot block the Assassin for someone else')
-                    else:
-                        await self.eliminate(sid, reason=f'Invalid influence to block the current action {current_action}')
-
                 else:
-                    await self.eliminate(sid, reason=f'Invalid action returned {answer}')
-
-        if all(answer for answer in self.has_answer.values()):
-            async with self.reaction_lock:
-                self.is_resolved.set()
+                    await self._resolve_answer(sid, target, current_action, answer)
+
+            answered.set_result(answer)
+            if all(future.done() for future in self.answers.values()):
+                self.resolve()
+
+    async def _resolve_answer(self, sid, target, current_action: Game.Action, answer: Game.Action):
+        # One lookup in the rules table, see games.Coup.legal.AnswerTable
+        kind = legal.answer_kind(current_action, answer)
+        if kind == legal.Answer.Challenge:
+            self.challenger = sid
+            self.resolve()
+        elif kind == legal.Answer.IllegalChallenge:
+            await self.eliminate(sid, reason=f'Tried to challenge a {current_action}')
+        elif kind == legal.Answer.Invalid:
+            await self.eliminate(sid, reason=f'Invalid action returned {answer}')
+        elif self.challenger is not None:  # Cannot have a block after a challenge
+            self.logger.debug('Late block by player %s. Action already challenged by %s', self.players[sid].pid,
+                              self.players[self.challenger].pid)
+        elif self.blocker is not None:
+            self.logger.debug('Action already blocked by %s', self.players[self.blocker[0]].pid)
+        elif kind == legal.Answer.IllegalBlock:
+            await self.eliminate(sid, reason=f'Invalid influence to block the current action {current_action}')
+        elif kind == legal.Answer.TargetBlock and sid != target:
+            await self.eliminate(sid, reason=f'Cannot block the {current_action} for someone else')
+        else:
+            self.blocker = (sid, answer)
+            self.resolve()
 
     async def kill(self, target):
         #  Shortcut if player only have one card left
         if len(self.player_influence_alive(target)) > 1:
 
             try:
-                selected_influence = await self.sio.call(CoupGame.Event.Kill.value, to=target, timeout=self.ActionTimeout)
+                selected_influence = await self.call(CoupGame.Event.Kill.value, target)
             except exceptions.TimeoutError:
                 selected_influence = None
 
             action = self.deserialize_action(selected_influence)
             if action is not None:
-                influences = [influence.action for influence in self.players[target].state['influences']]
+                # Only an influence still alive can be given up
+                influences = [influence.action if influence.alive else None
+                              for influence in self.players[target].state.influences]
                 if action in influences:
                     idx = influences.index(action)
-                    self.players[target].state['influences'][idx].alive = False
-                    await self.sio.send(f'Player {self.players[target].pid} remove the {action["type"]} from his influences', room=self.uuid)
-                    print(f'Player {self.players[target].pid} removed the {action["type"]}')
+                    self.players[target].state.influences[idx].alive = False
+                    self.log('Player %s removed the %s from his influences', self.players[target].pid, action)
                     return
             await self.sio.send(f'Invalid influence returned: {selected_influence}', room=self.players[target].sid)
             await self.eliminate(target, reason='Invalid influence returned')
@@ -270,12 +298,13 @@ class CoupGame(GameInterface):
         cards = tuple(self.deck.take(count))
 
         try:
-            discarded_cards = await self.sio.call(CoupGame.Event.Swap.value, (self.players[sid].pid, cards), to=sid, timeout=self.ActionTimeout)
+            discarded_cards = await self.call(CoupGame.Event.Swap.value, sid, (self.players[sid].pid, cards))
             if type(discarded_cards) is not tuple:
                 discarded_cards = tuple(discarded_cards)
             discarded_cards = tuple(self.deserialize_action(card) for card in discarded_cards)
         except exceptions.TimeoutError:
-            await self.sio.send(f'Player {self.players[sid].pid} timed out on swap answer. Random cards were selected', to=self.uuid)
+            self.log('Player %s timed out on swap answer. Random cards were selected', self.players[sid].pid,
+                     level=Game.LogLevel.Detail)
             discarded_cards = tuple(random.sample(self.player_influence_alive(sid)+cards, count))
 
         if discarded_cards is None:
@@ -284,7 +313,7 @@ class CoupGame(GameInterface):
             self.deck.shuffle()
             return
 
-        print(f'Player {self.players[sid].pid} received {[str(card) for card in cards]} and discarded {[str(card) for card in discarded_cards]}')
+        self.logger.debug('Player %s received %s and discarded %s', self.players[sid].pid, cards, discarded_cards)
 
         if len(discarded_cards) != count:
             await self.eliminate(sid, reason=f'Invalid number of card returned in swap. Expected: {count}. Actual: {len(discarded_cards)}')
@@ -312,70 +341,68 @@ class CoupGame(GameInterface):
                 self.deck.append(card)
         self.deck.shuffle()
 
-        self.players[sid].state['influences'] = [inf for inf in self.players[sid].state['influences'] if not inf.alive]
-        self.players[sid].state['influences'].extend([Influence(card) for card, discarded in match if not discarded])
+        self.players[sid].state.influences = [inf for inf in self.players[sid].state.influences if not inf.alive]
+        self.players[sid].state.influences.extend([Influence(card) for card, discarded in match if not discarded])
 
     async def lookup(self, sid, target):
 
         if not self.players[target].alive:
-            msg = f'Targeted player {self.players[target].pid} is now dead, skipping...'
-            print(msg)
-            await self.sio.send(msg, to=self.uuid)
+            self.log('Targeted player %s is now dead, skipping...', self.players[target].pid, level=Game.LogLevel.Detail)
             return
         try:
-            card = await self.sio.call(CoupGame.Event.Lookup.value, to=target, timeout=self.ActionTimeout)
+            card = await self.call(CoupGame.Event.Lookup.value, target)
             card = self.deserialize_action(card)
             if card not in self.player_influence_alive(target):
                 await self.eliminate(target, reason=f'Invalid answer to lookup event: {card}')
                 return
         except exceptions.TimeoutError:
-            await self.sio.send(f'Player {self.players[sid].pid} timed out on lookup event. Card was randomly choosen', to=self.uuid)
+            self.log('Player %s timed out on lookup event. Card was randomly choosen', self.players[sid].pid,
+                     level=Game.LogLevel.Detail)
             card = random.choice(self.player_influence_alive(target))
 
-        print(f'Player {self.players[target].pid} sent the card {str(card)}')
+        self.logger.debug('Player %s sent the card %s', self.players[target].pid, card)
 
         try:
-            replaced_card = await self.sio.call(CoupGame.Event.Swap.value, (self.players[target].pid, tuple(card)), to=sid, timeout=self.ActionTimeout)
+            replaced_card = await self.call(CoupGame.Event.Swap.value, sid, (self.players[target].pid, (card,)))
             replaced_card = self.deserialize_action(replaced_card)
         except exceptions.TimeoutError:
-            self.sio.send(f'Player {self.players[sid].pid} timed out on swap event. Card was randomly kept or replaced', to=self.uuid)
-            replaced_card = random.choice(card+(None,))
+            self.log('Player %s timed out on swap event. Card was randomly kept or replaced', self.players[sid].pid,
+                     level=Game.LogLevel.Detail)
+            replaced_card = random.choice((card, None))
 
         if replaced_card is None:
-            print(f'Player {self.players[sid].pid} asked to keep the card')
+            self.logger.debug('Player %s asked to keep the card', self.players[sid].pid)
         elif type(replaced_card) is type(card):
-            print(f'Player {self.players[sid].pid} asked to replace the card')
+            self.logger.debug('Player %s asked to replace the card', self.players[sid].pid)
             self.replace(target, card)
         else:
             await self.eliminate(sid, reason=f'Invalid card returned on lookup event: {replaced_card}')
 
     def replace(self, target, action: Game.Action):
-        actions = self.player_influence_alive(target)
-        idx = actions.index(action)
+        # Index in all the influences of the player, dead ones included
+        influences = self.players[target].state.influences
+        idx = next(i for i, influence in enumerate(influences) if influence.alive and influence.action == action)
         new_action = self.deck.replace(action)
-        self.players[target].state['influences'][idx] = Influence(new_action)
-        print(f'Player {self.players[target].pid} {action} was replaced with {new_action}')
+        self.players[target].state.influences[idx] = Influence(new_action)
+        self.logger.debug('Player %s %s was replaced with %s', self.players[target].pid, action, new_action)
 
     async def challenge(self, sid, target, action: Game.Action):
         #  This function return True if target won the challenge (target have the influence)
-        print(f'Player {self.players[target].pid} was challenged by player {self.players[sid].pid}')
-        await self.sio.send(f'Player {self.players[target].pid} was challenged by player {self.players[sid].pid}', room=self.uuid)
-        succeed = any(inf.alive and type(inf.action) is type(action) for inf in self.players[target].state['influences'])
+        self.log('Player %s was challenged by player %s', self.players[target].pid, self.players[sid].pid)
+        succeed = any(inf.alive and type(inf.action) is type(action) for inf in self.players[target].state.influences)
         if succeed:  # TODO inform the players the result of the challenge
-            print(f'Player {self.players[target].pid} won the challenge')
-            await self.sio.send(f'Player {self.players[target].pid} won the challenge', room=self.uuid)
+            self.log('Player %s won the challenge', self.players[target].pid)
             self.replace(target, action)
             await self.kill(sid)
         else:
-            print(f'Player {self.players[target].pid} lost the challenge')
-            await self.sio.send(f'Player {self.players[target].pid} lost the challenge', room=self.uuid)
+            self.log('Player %s lost the challenge', self.players[target].pid)
             await self.kill(target)
         await self.update()
         return succeed
 
     async def eliminate(self, target, invalid_action=True, reason=None):
         await super().eliminate(target, invalid_action, reason)
-        for influence in self.players[target].state['influences']:
+        for influence in self.players[target].state.influences:
             influence.alive = False
 
     @property
@@ -383,7 +410,7 @@ class CoupGame(GameInterface):
         return tuple(p for p in self.players if self.players[p].alive)
 
     def player_influence_alive(self, sid):
-        return tuple(influence['action'] for influence in self.players[sid].state['influences'] if influence.alive)
+        return tuple(influence.action for influence in self.players[sid].state.influences if influence.alive)
 
     def is_player_dead(self, sid):
         return len(self.player_influence_alive(sid)) == 0
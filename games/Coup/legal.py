@@ -0,0 +1,148 @@
+from enum import IntEnum
+from typing import Iterable, Iterator, List, Optional, Tuple, Type
+
+from games.Coup.actions import ActionCode, Income, ForeignAid, Coup, Duke, Contessa, Captain, Assassin, Ambassador, \
+    Inquisitor, Challenge
+from games.game_interface import Game
+
+# Actions a player may play on its turn, in the order of the turn moves
+TurnActions = (Income, ForeignAid, Coup, Duke, Captain, Assassin, Ambassador, Inquisitor)
+TurnIndex = {action: index for index, action in enumerate(TurnActions)}
+
+# Coins needed by each action as [min, max), max None for no limit, and whether it is played without target, on a target
+TurnRules = {
+    Income: (0, 10, True, False),
+    ForeignAid: (0, 10, True, False),
+    Coup: (7, None, False, True),
+    Duke: (0, 10, True, False),
+    Captain: (0, 10, False, True),
+    Assassin: (3, 10, False, True),
+    Ambassador: (0, None, True, False),
+    Inquisitor: (0, None, True, True),
+}
+MaxCoins = 10  # The legal moves are the same above
+
+NoTarget = 1  # Bit of a move without target, the move on the player pid is the bit pid + 1
+
+
+def _coin_moves(coins):
+    moves = []
+    for action in TurnActions:
+        min_coins, max_coins, untargeted, targeted = TurnRules[action]
+        allowed = min_coins <= coins and (max_coins is None or coins < max_coins)
+        moves.append((NoTarget if allowed and untargeted else 0, allowed and targeted))
+    return tuple(moves)
+
+
+# Bit of the move without target, and whether the targets are legal, of each turn action by coins
+CoinMoves = tuple(_coin_moves(coins) for coins in range(MaxCoins + 1))
+
+# Blocks of each action, and the actions only their target may block
+Blocks = {
+    ForeignAid: (Duke,),
+    Captain: (Captain, Ambassador, Inquisitor),
+    Assassin: (Contessa,),
+}
+TargetBlocks = {Captain, Assassin}
+BlockCards = {Duke, Contessa, Captain, Ambassador, Inquisitor}
+Unanswerable = {Income, Coup}  # Only announced, without reaction window
+Unchallengeable = {Income, ForeignAid, Coup}
+
+
+class Answer(IntEnum):
+    # Outcome of an answer to an action or a block, see AnswerTable
+    Invalid = 0  # Not a reaction
+    Challenge = 1
+    IllegalChallenge = 2  # Challenge of an action that cannot be challenged
+    Block = 3
+    TargetBlock = 4  # Block that only the target of the action may give
+    IllegalBlock = 5  # Card that does not block the action
+
+
+def _answer(action, answer):
+    if answer is Challenge:
+        return Answer.IllegalChallenge if action in Unchallengeable else Answer.Challenge
+    elif answer not in BlockCards:
+        return Answer.Invalid
+    elif answer not in Blocks.get(action, ()):
+        return Answer.IllegalBlock
+    return Answer.TargetBlock if action in TargetBlocks else Answer.Block
+
+
+# Answer of each (current action, answer), both indexed by ActionCode. The current action is a block once challenged.
+Actions = {action.code: action for action in (*TurnActions, Contessa, Challenge)}
+AnswerTable = tuple(
+    tuple(_answer(Actions.get(action), Actions.get(answer)) for answer in ActionCode)
+    for action in ActionCode
+)
+
+
+def _reaction_moves(action, is_target):
+    moves = 0
+    if action not in Unanswerable:
+        for answer in ActionCode:
+            kind = AnswerTable[action.code][answer]
+            if kind == Answer.Challenge or kind == Answer.Block or kind == Answer.TargetBlock and is_target:
+                moves |= 1 << answer
+    return moves
+
+
+# Answers to an action by its ActionCode, and whether the player answering is its target
+ReactionMoves = {(action.code, is_target): _reaction_moves(action, is_target)
+                 for action in TurnActions for is_target in (False, True)}
+# Answers to a block by its ActionCode, a block can only be challenged
+BlockMoves = {block.code: 1 << ActionCode.Challenge for block in BlockCards}
+
+
+def turn_moves(coins: int, targets: Iterable[int]) -> List[int]:
+    """Legal moves of a turn, the bitmask of the targets of each of TurnActions (bit 0 for no target).
+
+    targets are the public ids of the players that may be targeted, the other players still alive.
+    """
+    target_bits = 0
+    for pid in targets:
+        target_bits |= 2 << pid
+    return [untargeted | (target_bits if targeted else 0)
+            for untargeted, targeted in CoinMoves[min(coins, MaxCoins)]]
+
+
+def is_legal(moves: List[int], action: Game.Action, target_pid: Optional[int] = None) -> bool:
+    # Whether the answer to a turn request is one of the legal moves
+    index = TurnIndex.get(type(action))
+    if index is None:
+        return False
+    if target_pid is None:
+        return bool(moves[index] & NoTarget)
+    if type(target_pid) is not int or target_pid < 0:
+        return False
+    return bool(moves[index] >> (target_pid + 1) & 1)
+
+
+def legal_moves(moves: List[int]) -> Iterator[Tuple[Type[Game.Action], Optional[int]]]:
+    # (action, target public id) of each legal move
+    for action, targets in zip(TurnActions, moves):
+        bit = 0
+        while targets:
+            if targets & 1:
+                yield action, bit - 1 if bit else None
+            targets >>= 1
+            bit += 1
+
+
+def reaction_moves(action_code: int, is_target: bool) -> int:
+    """Bitmask of the ActionCode of the legal answers to an action. Passing is always legal."""
+    return ReactionMoves.get((action_code, is_target), 0)
+
+
+def block_moves(block_code: int) -> int:
+    """Bitmask of the ActionCode of the legal answers to a block. Passing is always legal."""
+    return BlockMoves.get(block_code, 0)
+
+
+def answer_kind(action: Game.Action, answer: Game.Action) -> Answer:
+    # Constant time resolution of an answer, the codes of the game actions are all in ActionCode
+    return AnswerTable[action.code][answer.code]
+
+
+def is_legal_reaction(moves: int, answer: Game.Action) -> bool:
+    return bool(moves >> answer.code & 1)
@@ -0,0 +1,55 @@
+import asyncio
+
+
+class _FastForwardSelector:
+
+    """Selector wrapper that moves the virtual clock forward instead of blocking until the next timer."""
+
+    def __init__(self, selector, loop: 'VirtualClockEventLoop'):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # Nothing scheduled: only an I/O event or another thread can wake up the loop
+            return self._selector.select(None)
+
+        events = self._selector.select(0)
+        if not events and timeout > 0:
+            self._loop.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+
+    """Event loop running on a virtual clock.
+
+    Whenever every task is waiting on a timer, the clock jumps straight to the next timer. Timeouts and sleeps then
+    complete instantly while keeping their relative order. This is only meant for games where every participant is a
+    local bot (see games.transport.LocalTransport): a remote player could never answer in virtual time.
+    """
+
+    def __init__(self, selector=None):
+        super().__init__(selector)
+        self._virtual_time = 0.0
+        self._selector = _FastForwardSelector(self._selector, self)
+
+    def time(self):
+        return self._virtual_time
+
+    def advance(self, seconds):
+        self._virtual_time += seconds
+
+
+def run_virtual(coroutine):
+    """Run a coroutine until completion in a new event loop on a virtual clock, and return its result."""
+    loop = VirtualClockEventLoop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,52 @@
+import base64
+import json
+from typing import Dict, Type
+
+import msgpack
+
+from games.game_interface import Game
+
+
+class MsgPackCodec:
+
+    """Binary codec given to socket.io in place of its json module, on both the server and the client.
+
+    msgpack encodes the packets natively. Only the objects it does not know go through default: actions are packed as a
+    one byte extension holding their code, and decoded to shared instances, so receiving an answer does not allocate
+    any action. Anything else is packed in its wire format. The game states are already in wire format, and are
+    decoded like their json.
+
+    python-socketio 4 only exchanges text packets, so the msgpack payload is framed as base64 after a '$' marker, which
+    keeps it apart from the socket.io header. Only event and ack payloads are packed, anything else is json.
+    """
+
+    Marker = '$'
+    ActionType = 1
+
+    def __init__(self, actions: Dict[str, Type[Game.Action]]):
+        self.actions = {0: Game.Action()}
+        self.actions.update({action.code: action() for action in actions.values()})
+        self.packer = msgpack.Packer(default=self.default, use_bin_type=True)
+
+    def default(self, obj):
+        if isinstance(obj, Game.Action):
+            return msgpack.ExtType(self.ActionType, bytes((obj.code,)))
+        return obj.to_wire()
+
+    def ext_hook(self, code, data):
+        if code == self.ActionType:
+            return self.actions.get(data[0])
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, obj, **kwargs):
+        # Only the socket.io events and acks are lists, the engine.io handshake must stay in json
+        if not isinstance(obj, (list, tuple)):
+            return json.dumps(obj, **kwargs)
+        return self.Marker + base64.b64encode(self.packer.pack(obj)).decode('ascii')
+
+    def loads(self, s, **kwargs):
+        if isinstance(s, bytes):
+            s = s.decode('utf-8')
+        if not s.startswith(self.Marker):
+            return json.loads(s, **kwargs)
+        return msgpack.unpackb(base64.b64decode(s[1:]), ext_hook=self.ext_hook, raw=False, strict_map_key=False)
@@ -0,0 +1,42 @@
+from typing import Dict, Optional
+
+
+def diff(old: Optional[Dict], new: Dict) -> Dict:
+    # Fields of new that are not in old or have a different value
+    if old is None:
+        return new
+    elif old is new:
+        return {}
+    return {key: val for key, val in new.items() if key not in old or old[key] != val}
+
+
+class StateTracker:
+
+    """Rebuild the full game state of a player from the versioned update_delta messages.
+
+    A message is {'version': int, 'snapshot': bool, 'state': dict}. A snapshot replaces the whole state, otherwise only
+    the fields present in the message are replaced: current_player, the fields of 'you' and the fields of each player
+    in 'others'. A delta that does not follow the current version is ignored until the next snapshot.
+    """
+
+    def __init__(self):
+        self.state = None
+        self.version = None
+        self.delta = None  # Fields replaced by the last message applied, the whole state after a snapshot
+
+    def apply(self, message) -> Optional[Dict]:
+        if message['snapshot']:
+            self.state = message['state']
+        elif self.state is None or message['version'] != self.version + 1:
+            return None
+        else:
+            delta = message['state']
+            if 'current_player' in delta:
+                self.state['current_player'] = delta['current_player']
+            self.state['you'].update(delta.get('you', {}))
+            for pid, fields in delta.get('others', {}).items():
+                self.state['others'].setdefault(pid, {}).update(fields)
+
+        self.version = message['version']
+        self.delta = message['state']
+        return self.state
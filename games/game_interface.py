@@ -1,48 +1,114 @@
 import asyncio
 import random
+import time
 import uuid
 from abc import abstractmethod
+from collections import defaultdict
+from contextlib import nullcontext
 
 from itertools import cycle, count
-from enum import Enum, auto
-from typing import Dict
+from enum import Enum, IntEnum, auto
+from typing import Dict, Optional
 
 from socketio import exceptions
 
+from games.delta import diff
+from games.log import game_logger
+from games.metrics import metrics
+from games.trace import GameTrace
+from games.transport import Transport, to_wire
+
+
+_untraced = nullcontext()
+
 
 class Game:
     class Status(Enum):
         Waiting = auto()
+        Scheduled = auto()  # Started, and waiting for a free slot of the scheduler. Nobody can join or leave anymore
         Running = auto()
         Aborted = auto()
         Finished = auto()
 
-    class Action(dict):
+    class LogLevel(IntEnum):
+        Off = 0
+        Summary = 1  # Outcome of the turns: activated and blocked actions, challenges, lost influences, eliminations
+        Detail = 2  # Everything else, like the timeouts and the skipped actions
+
+    class Action:
+
+        __slots__ = ()
+
+        code = 0  # Generic action, also used for hidden influences
 
         def __init__(self, *args, **kwargs):
-            super().__init__()
-            self['type'] = type(self).__name__
+            pass
             # TODO: implement action arguments
-            # self['args'] = args
-            # self['kwargs'] = kwargs
+            # self.args = args
+            # self.kwargs = kwargs
+
+        @property
+        def type(self):
+            return type(self).__name__
 
         def __str__(self):
             return type(self).__name__
 
-        async def validate(self, game: 'GameInterface', sid, target) -> bool:
-            return True
+        def __repr__(self):
+            return f'{type(self).__name__}()'
+
+        def __eq__(self, other):
+            return type(self) is type(other)
+
+        def __hash__(self):
+            return hash(type(self))
+
+        def to_wire(self):
+            return {'type': self.type}
 
         async def activate(self, game: 'GameInterface', sid, target):
             raise NotImplementedError()
 
+    class State:
+
+        """Base class of the player states. Each game declares its fields as __slots__."""
+
+        __slots__ = ()
+
+        def items(self):
+            return ((key, getattr(self, key)) for key in type(self).__slots__)
+
+        def fingerprint(self):
+            # Hashable value that changes whenever the state changes. None if the state cannot tell, so it is never cached
+            return None
+
+        def copy(self):
+            state = type(self).__new__(type(self))
+            for key, val in self.items():
+                setattr(state, key, val)
+            return state
+
+        def to_wire(self):
+            return dict(self.items())
+
     class Player:
 
-        def __init__(self, sid, pid):
+        __slots__ = ('sid', 'pid', 'alive', 'state', 'obfuscator', 'rtt', 'fused_turn', 'log_level', '_public_view',
+                     '_public_view_key')
+
+        RttSmoothing = 0.2  # Weight of the last measure in the average response time
+
+        def __init__(self, sid, pid, fused_turn=False, log_level=0):
             self.sid = sid
             self.pid = pid
             self.alive = True
-            self.state = {}
+            self.state = Game.State()
             self.obfuscator = None
+            self.rtt = None  # Average response time of the player, in seconds
+            self.fused_turn = fused_turn  # The state update is sent along with the turn request
+            self.log_level = Game.LogLevel(log_level)  # Verbosity of the game log sent to the player
+            self._public_view = None
+            self._public_view_key = None
 
         @property
         def public_state(self):
@@ -54,6 +120,22 @@ class Game:
                     public_state[key] = val
             return public_state
 
+        def record_rtt(self, seconds):
+            if self.rtt is None:
+                self.rtt = seconds
+            else:
+                self.rtt += self.RttSmoothing * (seconds - self.rtt)
+
+        @property
+        def public_view(self):
+            # Wire format of the public state seen by the other players. It is shared by all of them, so it is cached
+            # until the state changes, and must never be modified.
+            key = (self.alive, self.obfuscator, self.state.fingerprint())
+            if key[-1] is None or key != self._public_view_key:
+                self._public_view = to_wire({'id': self.pid, 'alive': self.alive, **self.public_state})
+                self._public_view_key = key
+            return self._public_view
+
     class Deck(list):
 
         def __init__(self, cards):
@@ -83,22 +165,30 @@ class GameInterface:
     MinPlayer = 2
     MaxPlayer = 10
     ActionTimeout = 1.0  # Max time for the players to answer to an action
-
-    # TODO settings
-    # action_timeout = float
+    AdaptiveTimeout = False  # Shorten the timeout according to the response time of the players
+    MinActionTimeout = 0.1  # Lower bound of an adaptive timeout
+    RttFactor = 4.0  # An adaptive timeout is this factor times the slowest average response time
+    DeltaUpdates = True  # Send only the changed fields of the state, see games.delta.StateTracker
+    SnapshotInterval = 20  # Number of versions between two full states, to resync the players
 
     Actions = {}
 
     class Event(Enum):
         Update = 'update'
+        UpdateDelta = 'update_delta'
         Turn = 'turn'
+        Log = 'game_log'
         Start = 'game_started'
         End = 'game_ended'
 
-    def __init__(self, sio, owner):
+    def __init__(self, sio: Transport, owner, action_timeout: Optional[float] = None,
+                 adaptive_timeout: Optional[bool] = None, trace: bool = False):
         self.sio = sio
         self.owner = owner
+        self.action_timeout = self.ActionTimeout if action_timeout is None else action_timeout
+        self.adaptive_timeout = self.AdaptiveTimeout if adaptive_timeout is None else adaptive_timeout
         self.uuid = str(uuid.uuid4())
+        self.logger = game_logger(self.uuid)
         self.players: Dict[str, Game.Player] = {}
         self.status = Game.Status.Waiting
         self.current_player = None
@@ -107,17 +197,31 @@ class GameInterface:
         self.actions = []
         self.player_order = None
         self.pid_generator = count(0)
-
-    async def add_player(self, sid):
+        self.state_version = 0
+        self.public_views = {}
+        self.private_views = {}
+        self.winner = None  # Public id of the winner
+        self.turn = 0
+        self.shuffle_seats = True  # Random turn order, otherwise the order in which the players joined
+        self.log_entries = []
+        self.round_trips = defaultdict(list)  # Response times of the players for each event, in seconds
+        self.metrics = metrics
+        self.trace = GameTrace(type(self).__name__) if trace else None
+        self.created_at = time.time()
+        self.last_activity = time.monotonic()
+
+    async def add_player(self, sid, fused_turn=False, log_level=0):
         async with self.lock:
             if sid not in self.players and self.status == Game.Status.Waiting:
                 # Make sure new player public id is unique in this game
-                self.players[sid] = Game.Player(sid, int(next(self.pid_generator)))
+                self.players[sid] = Game.Player(sid, int(next(self.pid_generator)), fused_turn, log_level)
+                self.last_activity = time.monotonic()
 
     async def remove_player(self, sid):
         async with self.lock:
             if sid in self.players and self.status == Game.Status.Waiting:
                 self.players.pop(sid)
+                self.last_activity = time.monotonic()
 
     @abstractmethod
     async def next_turn(self, action, target_pid):
@@ -128,13 +232,11 @@ class GameInterface:
         raise NotImplementedError()
 
     async def start(self):
-        await self.sio.emit(GameInterface.Event.Start.value, (self.uuid, self.nb_player))
+        await self.sio.emit(GameInterface.Event.Start.value, (self.uuid, self.nb_player), room=self.uuid)
 
         async with self.lock:
             self.status = Game.Status.Running
-            player_sid = list(self.players.keys())
-            random.shuffle(player_sid)
-            self.player_order = cycle(player_sid)
+            self.player_order = cycle(self.seat_order())
             while self.status == Game.Status.Running:
                 winners = [p for p, v in self.players.items() if v.alive]
                 if len(winners) < 2:
@@ -142,18 +244,35 @@ class GameInterface:
                 else:
                     await self._next_turn()
 
+        self.last_activity = time.monotonic()
         if len(winners) == 1:
             winner = winners[0]
-            print(f'Player {self.players[winner].pid} won the game.')
+            self.winner = self.players[winner].pid
+            self.log('Player %s won the game.', self.players[winner].pid)
+            await self.flush_log()
             await self.sio.emit(GameInterface.Event.End.value, self.players[winner].pid, room=self.uuid)
         else:
             winner = None
-            print(f'Tie game')
+            self.log('Tie game')
+            await self.flush_log()
             await self.sio.emit(GameInterface.Event.End.value, None, room=self.uuid)
 
         return winner
 
+    def seat_order(self):
+        # Order in which the players take their turns
+        player_sid = list(self.players.keys())
+        if self.shuffle_seats:
+            random.shuffle(player_sid)
+        return player_sid
+
     async def _next_turn(self):
+        with self.phase('turn', turn=self.turn + 1):
+            await self._play_turn()
+
+    async def _play_turn(self):
+        self.turn += 1
+        self.last_activity = time.monotonic()
         self.current_player = self.players[next(self.player_order)]
         self.current_action = None
         answer = None
@@ -161,10 +280,17 @@ class GameInterface:
         while not self.current_player.alive:
             self.current_player = self.players[next(self.player_order)]
 
-        await self.update()
+        # The current player may get its update with the turn request, in a single round trip
+        fused_sid = self.current_player.sid if self.current_player.fused_turn else None
+        with self.phase('update'):
+            fused_update = await self.update(fused_sid)
+
+        # The legal moves come with the turn request, after the update (None, None when it is not fused)
+        moves = self.legal_moves(self.current_player.sid)
+        request = (*(fused_update or (None, None)), moves)
 
         try:
-            answer = await self.sio.call(GameInterface.Event.Turn.value, to=self.current_player.sid, timeout=self.ActionTimeout)
+            answer = await self.call(GameInterface.Event.Turn.value, self.current_player.sid, request)
             if len(answer) == 2:
                 action, target_pid = answer
             else:
@@ -176,23 +302,145 @@ class GameInterface:
         except TypeError as err:
             action = None
             target_pid = None
-            print(err)
+            self.logger.warning(err)
 
-        action = await self._deserialize_action(action)
-        self.current_action = await self.validate_action(action, self.current_player.sid, target_pid)
+        with self.phase('validation'):
+            action = await self._deserialize_action(action)
+            self.current_action = await self.validate_action(action, target_pid, moves)
 
         if self.current_action is None:
             await self.eliminate(self.current_player.sid, reason=f'Invalid turn response: {answer}')
         else:
-            await self.next_turn(self.current_action, target_pid)
+            with self.phase('next_turn', action=str(self.current_action)):
+                await self.next_turn(self.current_action, target_pid)
+
+        await self.flush_log()
+
+    @property
+    def summary(self):
+        # Compact record of the game, kept once the game itself is discarded
+        return {
+            'uuid': self.uuid,
+            'status': self.status.name,
+            'nb_player': self.nb_player,
+            'turns': self.turn,
+            'winner': self.winner,
+            'created_at': self.created_at,
+        }
+
+    @property
+    def settings(self):
+        return {'action_timeout': self.action_timeout, 'adaptive_timeout': self.adaptive_timeout,
+                'trace': self.trace is not None}
+
+    def phase(self, name, sid=None, **args):
+        # Time a phase of the game, or the wait for the player sid, when the game is traced
+        if self.trace is None:
+            return _untraced
+        return self.trace.phase(name, self.players[sid].pid if sid is not None else None, **args)
+
+    def timeout(self, *sids):
+        # Time given to the players to answer. When adaptive, it follows the slowest of them.
+        if not self.adaptive_timeout or not sids:
+            return self.action_timeout
+        rtts = [self.players[sid].rtt for sid in sids]
+        if None in rtts:
+            return self.action_timeout
+        return min(self.action_timeout, max(self.MinActionTimeout, self.RttFactor * max(rtts)))
+
+    async def call(self, event, sid, data=None):
+        # Call a player within its timeout, and measure its response time
+        loop = asyncio.get_event_loop()
+        sent_at = loop.time()
+        try:
+            with self.phase(event, sid):
+                answer = await self.sio.call(event, data, to=sid, timeout=self.timeout(sid))
+        except exceptions.TimeoutError:
+            self.metrics.timeouts.inc(event=event)
+            raise
+        self.record_rtt(event, sid, loop.time() - sent_at)
+        return answer
+
+    def record_rtt(self, event, sid, seconds):
+        self.players[sid].record_rtt(seconds)
+        self.round_trips[event].append(seconds)
+
+    async def update(self, fused_sid=None):
+        # Every view is built once per update, and shared by all the players. The update of fused_sid is not emitted
+        # but returned as an (event, message) pair, to be sent with the turn request.
+        fused_update = None
+        public_views = {p.pid: p.public_view for p in self.players.values()}
+        private_views = {p.pid: to_wire({'id': p.pid, 'alive': p.alive, **dict(p.state.items())})
+                         for p in self.players.values()}
+
+        if not self.DeltaUpdates:
+            for player in self.players.values():
+                state = {
+                    'current_player': self.current_player.pid,
+                    'others': {pid: view for pid, view in public_views.items() if pid != player.pid},
+                    'you': private_views[player.pid]
+                }
+                if player.sid == fused_sid:
+                    fused_update = (GameInterface.Event.Update.value, state)
+                else:
+                    await self.sio.emit(GameInterface.Event.Update.value, state, room=player.sid)
+            return fused_update
+
+        self.state_version += 1
+        snapshot = (self.state_version - 1) % self.SnapshotInterval == 0
+        changed_views = {}
+        for pid, view in public_views.items():
+            changes = diff(self.public_views.get(pid), view)
+            if changes:
+                changed_views[pid] = changes
+
+        for player in self.players.values():
+            if snapshot:
+                state = {
+                    'current_player': self.current_player.pid,
+                    'others': {pid: view for pid, view in public_views.items() if pid != player.pid},
+                    'you': private_views[player.pid]
+                }
+            else:
+                state = {
+                    'current_player': self.current_player.pid,
+                    'others': {pid: changes for pid, changes in changed_views.items() if pid != player.pid},
+                    'you': diff(self.private_views.get(player.pid), private_views[player.pid])
+                }
+            message = {'version': self.state_version, 'snapshot': snapshot, 'state': state}
+            if player.sid == fused_sid:
+                fused_update = (GameInterface.Event.UpdateDelta.value, message)
+            else:
+                await self.sio.emit(GameInterface.Event.UpdateDelta.value, message, room=player.sid)
+
+        self.public_views = public_views
+        self.private_views = private_views
+        return fused_update
+
+    def log(self, msg, *args, level=Game.LogLevel.Summary):
+        # Event of the game, in the server logs and in the game log sent at the end of the turn to the players subscribed
+        # to this level. Like logging, msg % args is only formatted when it is read.
+        self.logger.info(msg, *args)
+        self.log_entries.append((level, msg, args))
+
+    async def flush_log(self):
+        # A single game_log event per turn and player, instead of a message for each entry
+        entries, self.log_entries = self.log_entries, []
+        if not entries or all(player.log_level == Game.LogLevel.Off for player in self.players.values()):
+            return
+        entries = [(level, msg % args if args else msg) for level, msg, args in entries]
 
-    async def update(self):
-        state = {'current_player': self.current_player.pid}
+        logs = {}
         for player in self.players.values():
-            state['others'] = {p.pid: {'id': p.pid, 'alive': p.alive, **p.public_state}
-                               for p in self.players.values() if p.pid != player.pid}
-            state['you'] = {'id': player.pid, 'alive': player.alive, **player.state}
-            await self.sio.emit(GameInterface.Event.Update.value, state, room=player.sid)
+            if player.log_level == Game.LogLevel.Off:
+                continue
+            if player.log_level not in logs:
+                logs[player.log_level] = {
+                    'turn': self.turn,
+                    'entries': [msg for level, msg in entries if level <= player.log_level]
+                }
+            if logs[player.log_level]['entries']:
+                await self.sio.emit(GameInterface.Event.Log.value, logs[player.log_level], room=player.sid)
 
     async def eliminate(self, target, invalid_action=True, reason=None):
         self.players[target].alive = False
@@ -202,18 +450,22 @@ class GameInterface:
             msg += f' for an invalid action.'
         if reason:
             msg += ' Reason: ' + reason
-        print(msg)
-        await self.sio.send(msg, room=self.uuid)
+        self.log(msg)
+        # Only the fixed part of the reason, before any detail, so the number of labels stays bounded
+        self.metrics.eliminations.inc(reason=reason.split(':')[0].split('.')[0] if reason else 'none')
 
     @classmethod
     def deserialize_action(cls, action: dict):
-        # TODO replace with custom json encoder/decoder in socketio
+        # Actions decoded by a codec (see games.codec) are already deserialized
+        if isinstance(action, Game.Action):
+            return action if type(action) in cls.Actions.values() else None
+
         if not type(action) is dict:
             return
 
-        action_type = cls.Actions.get(action['type'])
+        action_type = cls.Actions.get(action.get('type'))
 
-        if not issubclass(action_type, Game.Action):
+        if action_type is None or not issubclass(action_type, Game.Action):
             return
 
         # TODO implement action arguments
@@ -226,24 +478,21 @@ class GameInterface:
             await self.sio.send(f'Invalid action', room=self.current_player.sid)
         return action
 
-    async def validate_action(self, action: Game.Action, sid, target_pid):
-
-        if action is None:
-            return
-        elif target_pid is not None and target_pid not in (self.players[p].pid for p in self.players):
-            await self.sio.send(f'Invalid player selected: {target_pid}', room=self.current_player.sid)
-            return
+    @abstractmethod
+    def legal_moves(self, sid):
+        # Moves the player may play on its turn, sent with the turn request
+        raise NotImplementedError()
 
-        target = self.pid_to_sid(target_pid)
+    @abstractmethod
+    def is_legal_move(self, moves, action: Game.Action, target_pid) -> bool:
+        raise NotImplementedError()
 
-        if target and self.is_player_dead(target):
-            await self.sio.send(f'Selected player is dead: {target_pid}', room=self.current_player.sid)
+    async def validate_action(self, action: Game.Action, target_pid, moves):
+        if action is None:
             return
-
-        if not await action.validate(self, sid, target):
-            await self.sio.send(f'Invalid action', room=self.current_player.sid)
+        if not self.is_legal_move(moves, action, target_pid):
+            await self.sio.send(f'Illegal move: {action} on {target_pid}', room=self.current_player.sid)
             return
-
         return action
 
     def pid_to_sid(self, pid):
@@ -257,7 +506,7 @@ class GameInterface:
 
     @property
     def is_full(self):
-        return self.nb_player > self.MaxPlayer and self.status == Game.Status.Waiting
+        return self.nb_player >= self.MaxPlayer and self.status == Game.Status.Waiting
 
     @property
     def is_valid(self):
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import sys
+import threading
+import weakref
+from collections import deque
+from typing import Iterable, Optional
+
+logger = logging.getLogger('coupio')
+_handlers = weakref.WeakSet()  # RingBufferHandler instances, restarted in the child processes
+
+
+def _restart_handlers():
+    # Threads do not survive a fork, the worker processes need their own writer
+    for handler in list(_handlers):
+        handler.start()
+
+
+os.register_at_fork(after_in_child=_restart_handlers)
+
+
+def game_logger(game_uuid):
+    # The records of a game carry its uuid, for the per-game filter and the json lines
+    return logging.LoggerAdapter(logger, {'game': game_uuid})
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        line = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'game': getattr(record, 'game', None),
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            line['exc'] = self.formatException(record.exc_info)
+        return json.dumps(line)
+
+
+class GameFilter(logging.Filter):
+
+    """Keep the records of the given games, and the records that are not about a game."""
+
+    def __init__(self, games: Iterable[str]):
+        super().__init__()
+        self.games = set(games)
+
+    def filter(self, record):
+        game = getattr(record, 'game', None)
+        return game is None or game in self.games
+
+
+class RingBufferHandler(logging.Handler):
+
+    """Handler that never blocks the event loop.
+
+    Records are appended to a bounded ring buffer, and written to the stream by a background thread every interval
+    seconds. When the writer cannot keep up, the oldest records are dropped, and the number of dropped records is logged.
+    """
+
+    def __init__(self, stream=None, capacity: int = 10000, interval: float = 0.1):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.buffer = deque(maxlen=capacity)
+        self.interval = interval
+        self.dropped = 0
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = None
+        self.start()
+        _handlers.add(self)
+
+    def start(self):
+        if self.closed:
+            return
+        self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def emit(self, record):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(record)
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.write()
+
+    def write(self):
+        lines = []
+        while self.buffer:
+            record = self.buffer.popleft()
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            lines.append(f'{dropped} log record(s) dropped')
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+    def flush(self):
+        self.write()
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.write()
+        super().close()
+
+
+def configure_logging(level='INFO', games: Optional[Iterable[str]] = None, json_lines=False, capacity=10000,
+                      stream=None):
+    """Send the records of the server and the games to a RingBufferHandler. The level OFF disables every record."""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    if level == 'OFF':
+        logger.disabled = True
+        return
+    logger.disabled = False
+    logger.setLevel(level)
+    logger.propagate = False
+
+    handler = RingBufferHandler(stream, capacity)
+    if json_lines:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    if games:
+        handler.addFilter(GameFilter(games))
+    logger.addHandler(handler)
@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from typing import Dict, Tuple
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+
+    Type = None
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}  # Values of the metric for each combination of label values
+
+    def key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def format_labels(self, key, **extra):
+        pairs = [*zip(self.labels, key), *extra.items()]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{label}="{escape(value)}"' for label, value in pairs) + '}'
+
+    def render(self):
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} {self.Type}'
+
+
+class Counter(Metric):
+
+    Type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values):
+        for key, value in values.items():
+            self.values[key] = self.values.get(key, 0) + value
+
+    def render(self):
+        yield from super().render()
+        if not self.labels and not self.values:
+            yield f'{self.name} 0'
+        for key, value in self.values.items():
+            yield f'{self.name}{self.format_labels(key)} {value}'
+
+
+class Histogram(Metric):
+
+    """Count of the observed values per bucket. Like in Prometheus, the buckets are upper bounds in seconds."""
+
+    Type = 'histogram'
+    Buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        if key not in self.values:
+            # One count per bucket, then the count above the last bucket, the sum and the total count
+            self.values[key] = [0] * (len(self.Buckets) + 1) + [0.0, 0]
+        counts = self.values[key]
+        counts[bisect_left(self.Buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def merge(self, values):
+        for key, counts in values.items():
+            if key not in self.values:
+                self.values[key] = list(counts)
+            else:
+                self.values[key] = [mine + other for mine, other in zip(self.values[key], counts)]
+
+    def render(self):
+        yield from super().render()
+        for key, counts in self.values.items():
+            cumulated = 0
+            for bound, count in zip((*self.Buckets, '+Inf'), counts):
+                cumulated += count
+                yield f'{self.name}_bucket{self.format_labels(key, le=bound)} {cumulated}'
+            yield f'{self.name}_sum{self.format_labels(key)} {counts[-2]}'
+            yield f'{self.name}_count{self.format_labels(key)} {counts[-1]}'
+
+
+class MetricsRegistry:
+
+    """Counters and histograms of the server and the games, rendered in the Prometheus text format.
+
+    Every registry declares the same metrics, so the registry of a game played in a worker process can be dumped and
+    merged into the registry of the server.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.games_created = self.add(Counter('coupio_games_created_total', 'Games created'))
+        self.games_started = self.add(Counter('coupio_games_started_total', 'Games started'))
+        self.games_finished = self.add(Counter('coupio_games_finished_total', 'Games played until the end'))
+        self.games_aborted = self.add(Counter('coupio_games_aborted_total', 'Games aborted, started or not'))
+        self.eliminations = self.add(Counter('coupio_eliminations_total', 'Players eliminated, by reason', ('reason',)))
+        self.timeouts = self.add(Counter('coupio_timeouts_total', 'Players that did not answer in time, by event',
+                                         ('event',)))
+        self.reaction_windows = self.add(Histogram('coupio_reaction_window_seconds',
+                                                   'Time the reaction windows were open, by event', ('event',)))
+        self.loop_lag = self.add(Histogram('coupio_event_loop_lag_seconds',
+                                           'Delay of the event loop to run a task scheduled on time'))
+
+    def add(self, metric: Metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def dump(self):
+        return {name: dict(metric.values) for name, metric in self.metrics.items()}
+
+    def merge(self, dump):
+        for name, values in dump.items():
+            self.metrics[name].merge(values)
+
+    def render(self):
+        return '\n'.join(line for metric in self.metrics.values() for line in metric.render()) + '\n'
+
+
+metrics = MetricsRegistry()  # Registry of the current process
@@ -0,0 +1,58 @@
+import json
+import time
+from contextlib import contextmanager
+
+
+class GameTrace:
+
+    """Timeline of the phases of a game, exported in the Chrome trace event format (chrome://tracing, Perfetto).
+
+    The phases of the game itself are on a first track, and the phases waiting for a player, like its answer to an
+    event, on one track per player.
+    """
+
+    GameTrack = 0
+
+    def __init__(self, name='game'):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.events = []
+        self.tracks = {self.GameTrack: 'Game'}
+
+    def track(self, player_pid=None):
+        if player_pid is None:
+            return self.GameTrack
+        track = player_pid + 1
+        if track not in self.tracks:
+            self.tracks[track] = f'Player {player_pid}'
+        return track
+
+    def add(self, name, start, end, player_pid=None, **args):
+        # start and end are time.perf_counter() timestamps
+        self.events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': 0,
+            'tid': self.track(player_pid),
+            'args': args,
+        })
+
+    @contextmanager
+    def phase(self, name, player_pid=None, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), player_pid, **args)
+
+    def to_chrome(self):
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': 0, 'args': {'name': self.name}}]
+        metadata.extend({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': track, 'args': {'name': name}}
+                        for track, name in self.tracks.items())
+        return {'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_chrome(), file)
@@ -0,0 +1,220 @@
+import asyncio
+import inspect
+import json
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from itertools import count
+from typing import Dict, Type
+
+import socketio
+from socketio import exceptions
+
+from games.delta import StateTracker
+from games.log import logger
+
+
+class Transport(ABC):
+
+    """Interface used by the games to talk to their players.
+
+    It is the subset of socketio.AsyncServer used by the games, so the socket.io server is a valid transport as is.
+    """
+
+    @abstractmethod
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, callback=None):
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def send(self, data, to=None, room=None, skip_sid=None):
+        raise NotImplementedError()
+
+    @abstractmethod
+    async def call(self, event, data=None, to=None, timeout=60):
+        raise NotImplementedError()
+
+
+Transport.register(socketio.AsyncServer)
+
+
+def to_wire(data):
+    # Same structure the players would get from a json round trip, without the json
+    if isinstance(data, dict):
+        return {key: to_wire(val) for key, val in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return [to_wire(val) for val in data]
+    elif data is None or isinstance(data, (str, int, float)):
+        return data
+    return to_wire(data.to_wire())
+
+
+class WireJson:
+
+    """json module given to socket.io. The game objects (actions, influences, states) are encoded to their wire format."""
+
+    @staticmethod
+    def default(obj):
+        if hasattr(obj, 'to_wire'):
+            return obj.to_wire()
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return json.dumps(obj, default=WireJson.default, **kwargs)
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return json.loads(s, **kwargs)
+
+
+class LocalTransport(Transport):
+
+    """In-process transport routing the game events straight to bot instances.
+
+    An event is dispatched to the ``on_<event>`` coroutine of the bot, and its return value is used as the answer.
+    Like the client, the state deltas are merged before calling ``on_update``, including the update carried by a fused
+    turn request. Messages and events without handler are dropped. Nothing goes through the network, so bot-only games are only
+    limited by the game logic.
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.bots = {}
+        self.rooms = defaultdict(set)
+        self.trackers = {}
+        self.sid_generator = count(0)
+        self.tasks = set()
+
+    def connect(self, bot):
+        sid = f'local-{next(self.sid_generator)}'
+        self.bots[sid] = bot
+        self.trackers[sid] = StateTracker()
+        return sid
+
+    def disconnect(self, sid):
+        self.bots.pop(sid, None)
+        self.trackers.pop(sid, None)
+        for room in self.rooms.values():
+            room.discard(sid)
+
+    def enter_room(self, sid, room):
+        self.rooms[room].add(sid)
+
+    def close_room(self, room):
+        self.rooms.pop(room, None)
+
+    def recipients(self, to=None, room=None, skip_sid=None):
+        to = to or room
+        if to is None:
+            sids = list(self.bots)
+        elif to in self.bots:
+            sids = [to]
+        else:
+            sids = list(self.rooms.get(to, ()))
+        return [sid for sid in sids if sid != skip_sid]
+
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, callback=None):
+        args = self.to_args(data)
+        for sid in self.recipients(to, room, skip_sid):
+            if callback is None:
+                try:
+                    await self.dispatch(sid, event, args)
+                except Exception as ex:
+                    self.on_error(sid, event, ex)
+            else:
+                task = asyncio.ensure_future(self._acknowledge(sid, event, args, callback))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def send(self, data, to=None, room=None, skip_sid=None):
+        if self.verbose:
+            print(data)
+        await self.emit('message', data, to=to, room=room, skip_sid=skip_sid)
+
+    async def call(self, event, data=None, to=None, timeout=60):
+        try:
+            answer = await asyncio.wait_for(self.dispatch(to, event, self.to_args(data)), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise exceptions.TimeoutError()
+        except Exception as ex:
+            # Like a crashing client, the bot never answers
+            self.on_error(to, event, ex)
+            raise exceptions.TimeoutError()
+
+        if len(answer) == 0:
+            return None
+        elif len(answer) == 1:
+            return answer[0]
+        return answer
+
+    async def dispatch(self, sid, event, args):
+        bot = self.bots.get(sid)
+        if event == 'update_delta':
+            tracker = self.trackers[sid]
+            game_state = tracker.apply(*args)
+            if game_state is None:
+                return ()
+            bot.state_delta = tracker.delta
+            event, args = 'update', (game_state,)
+        elif event == 'turn' and args:
+            # The update of a fused turn comes first, then the legal moves
+            update_event, message, bot.legal_moves = args
+            if update_event is not None:
+                await self.dispatch(sid, update_event, (message,))
+            args = ()
+
+        handler = getattr(bot, 'on_' + event, None)
+        if handler is None:
+            return ()
+
+        answer = handler(*args)
+        if inspect.isawaitable(answer):
+            answer = await answer
+        return self.to_args(answer)
+
+    def on_error(self, sid, event, ex):
+        logger.warning('Bot %s failed on event %s: %r', type(self.bots.get(sid)).__name__, event, ex)
+
+    async def _acknowledge(self, sid, event, args, callback):
+        try:
+            answer = await self.dispatch(sid, event, args)
+        except Exception as ex:
+            self.on_error(sid, event, ex)
+            return
+        result = callback(*answer)
+        if inspect.isawaitable(result):
+            await result
+
+    @staticmethod
+    def to_args(data):
+        if data is None:
+            return ()
+        elif isinstance(data, tuple):
+            return tuple(to_wire(arg) for arg in data)
+        return to_wire(data),
+
+
+async def play_local_game(game_class: Type, bots, shuffle_seats=True, **kwargs):
+    """Play a game between bot instances in the current event loop, and return the winning bot (None on a tie).
+
+    Without shuffle_seats, the bots play their turns in the order of the list.
+    """
+    transport = LocalTransport(**kwargs)
+    sids: Dict[str, object] = {transport.connect(bot): bot for bot in bots}
+
+    game = game_class(transport, next(iter(sids)))
+    game.shuffle_seats = shuffle_seats
+    for sid in sids:
+        transport.enter_room(sid, game.uuid)
+        await game.add_player(sid, getattr(sids[sid], 'fused_turn', False), getattr(sids[sid], 'log_level', 0))
+
+    for bot in bots:
+        await bot.start(game.nb_player)
+
+    try:
+        winner = await game.start()
+    finally:
+        transport.close_room(game.uuid)
+        for task in transport.tasks:
+            task.cancel()
+
+    return sids.get(winner)
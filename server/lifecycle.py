@@ -0,0 +1,70 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from games.game_interface import GameInterface, Game
+from server.matchmaking import OpenGames
+from server.scheduler import GameScheduler
+
+
+class GameLifecycle:
+
+    """Evict the games the server does not need anymore.
+
+    Finished and aborted games are removed after a short grace period, and waiting games without any activity for
+    idle_ttl seconds are aborted then removed. The summary of each evicted game is kept in a bounded archive.
+    """
+
+    def __init__(self, games: Dict[str, GameInterface], open_games: OpenGames, scheduler: GameScheduler,
+                 on_idle: Callable[[GameInterface], Awaitable], idle_ttl: float = 600.0, grace: float = 5.0,
+                 interval: float = 10.0, archive_size: int = 1000):
+        self.games = games
+        self.open_games = open_games
+        self.scheduler = scheduler
+        self.on_idle = on_idle
+        self.idle_ttl = idle_ttl
+        self.grace = grace
+        self.interval = interval
+        self.archive = deque(maxlen=archive_size)
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def counts(self):
+        counts = {'live': 0, 'scheduled': 0, 'waiting': 0, 'archived': len(self.archive)}
+        for game in self.games.values():
+            if game.status == Game.Status.Running:
+                counts['live'] += 1
+            elif game.status == Game.Status.Scheduled:
+                counts['scheduled'] += 1
+            elif game.status == Game.Status.Waiting:
+                counts['waiting'] += 1
+        return counts
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.reap()
+
+    async def reap(self):
+        now = time.monotonic()
+        for game in list(self.games.values()):
+            if game.uuid in self.scheduler:
+                continue
+            elif game.status in {Game.Status.Finished, Game.Status.Aborted}:
+                if now - game.last_activity >= self.grace:
+                    self.evict(game)
+            elif game.status == Game.Status.Waiting and now - game.last_activity >= self.idle_ttl:
+                game.logger.info('Game %s was idle for too long', game.uuid)
+                await self.on_idle(game)
+                self.evict(game)
+
+    def evict(self, game: GameInterface):
+        self.games.pop(game.uuid, None)
+        self.open_games.remove(game.uuid)
+        if self.archive.maxlen:
+            self.archive.append(game.summary)
@@ -0,0 +1,132 @@
+import asyncio
+import random
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from games.game_interface import GameInterface
+
+
+class RandomSet:
+
+    """Set supporting O(1) add, discard and random choice."""
+
+    def __init__(self):
+        self.items = []
+        self.index = {}
+
+    def add(self, item):
+        if item not in self.index:
+            self.index[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        idx = self.index.pop(item, None)
+        if idx is not None:
+            last = self.items.pop()
+            if idx < len(self.items):
+                self.items[idx] = last
+                self.index[last] = idx
+
+    def choice(self):
+        return random.choice(self.items)
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def __len__(self):
+        return len(self.items)
+
+
+class OpenGames:
+
+    """Index of the games that players can join, bucketed by number of players.
+
+    The index must be refreshed whenever a player joins or leaves a game, or a game starts. Selecting a game only looks
+    at the buckets, whose number is bounded by the maximum number of players.
+    """
+
+    def __init__(self):
+        self.games: Dict[str, GameInterface] = {}
+        self.buckets = defaultdict(RandomSet)
+        self.location = {}
+
+    def update(self, game: GameInterface):
+        self.remove(game.uuid)
+        if game.is_valid:
+            self.games[game.uuid] = game
+            self.location[game.uuid] = game.nb_player
+            self.buckets[game.nb_player].add(game.uuid)
+
+    def remove(self, game_uuid):
+        nb_player = self.location.pop(game_uuid, None)
+        if nb_player is not None:
+            self.games.pop(game_uuid)
+            self.buckets[nb_player].discard(game_uuid)
+
+    def random(self) -> Optional[GameInterface]:
+        # Every open game has the same chance to be selected
+        if not self.games:
+            return None
+        idx = random.randrange(len(self.games))
+        for bucket in self.buckets.values():
+            if idx < len(bucket):
+                return self.games[bucket.items[idx]]
+            idx -= len(bucket)
+
+    def fill_first(self) -> Optional[GameInterface]:
+        # A random game among the ones with the most players
+        for nb_player in sorted(self.buckets, reverse=True):
+            if self.buckets[nb_player]:
+                return self.games[self.buckets[nb_player].choice()]
+        return None
+
+    def __contains__(self, game_uuid):
+        return game_uuid in self.location
+
+    def __len__(self):
+        return len(self.games)
+
+
+class MatchmakingQueue:
+
+    """Group the waiting clients into new games.
+
+    A group is formed as soon as max_player clients are waiting, or when at least min_player clients have been waiting
+    for batch_window seconds.
+    """
+
+    def __init__(self, min_player: int, max_player: int, on_match: Callable[[List[str]], Awaitable],
+                 batch_window: float = 1.0):
+        self.min_player = min_player
+        self.max_player = max_player
+        self.on_match = on_match
+        self.batch_window = batch_window
+        self.waiting = {}  # Used as an ordered set
+        self.timer = None
+
+    def join(self, sid):
+        self.waiting[sid] = None
+        if len(self.waiting) >= self.max_player:
+            self.flush(full_only=True)
+        if len(self.waiting) >= self.min_player and self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.batch_window, self.flush)
+
+    def leave(self, sid):
+        self.waiting.pop(sid, None)
+
+    def flush(self, full_only=False):
+        if not full_only and self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        while len(self.waiting) >= (self.max_player if full_only else self.min_player):
+            group = list(self.waiting)[:self.max_player]
+            for sid in group:
+                self.waiting.pop(sid)
+            asyncio.ensure_future(self.on_match(group))
+
+    def __contains__(self, sid):
+        return sid in self.waiting
+
+    def __len__(self):
+        return len(self.waiting)
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Optional
+
+from aiohttp import web
+
+from games.metrics import MetricsRegistry, metrics
+
+
+class LoopLagMonitor:
+
+    """Measure how late the event loop runs a callback scheduled every interval seconds.
+
+    A lag means something blocks the loop, and delays every game of the process.
+    """
+
+    def __init__(self, registry: MetricsRegistry = metrics, interval: float = 0.5):
+        self.registry = registry
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.registry.loop_lag.observe(max(0.0, loop.time() - expected))
+
+
+ContentType = 'text/plain; version=0.0.4; charset=utf-8'  # Prometheus text format
+
+
+def add_metrics_route(app: web.Application, registry: MetricsRegistry = metrics, path='/metrics'):
+    """Serve the metrics in the Prometheus text format, and monitor the event loop while the app is running."""
+    monitor = LoopLagMonitor(registry)
+
+    async def handle_metrics(request):
+        return web.Response(body=registry.render().encode(), headers={'Content-Type': ContentType})
+
+    async def on_startup(app):
+        monitor.start()
+
+    async def on_cleanup(app):
+        monitor.stop()
+
+    app.router.add_get(path, handle_metrics)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
@@ -0,0 +1,296 @@
+import asyncio
+import functools
+import inspect
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import suppress
+from itertools import count
+from typing import Callable, Dict, Optional
+
+from socketio import exceptions
+
+from games.game_interface import GameInterface, Game
+from games.log import game_logger, logger
+from games.metrics import MetricsRegistry
+from games.transport import Transport
+
+
+class RemoteSocket(Transport):
+
+    """Stand-in for the socket.io server inside a worker process.
+
+    Every emit, send and call made by a game is relayed through a pipe to the main process, which owns the real
+    socket.io server. Acknowledgement callbacks and call results are relayed back the same way.
+    """
+
+    ResultGrace = 1.0  # Time given to the main process to relay the timeout of a call, before the worker gives up
+    CallbackTtl = 600.0  # An acknowledgement callback not called within this time is dropped, the client is gone
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.callback_id = count(0)
+        self.request_id = count(0)
+        self.callbacks = {}
+        self.requests: Dict[int, asyncio.Future] = {}
+
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, callback=None):
+        callback_id = None
+        if callback is not None:
+            callback_id = next(self.callback_id)
+            self.callbacks[callback_id] = callback
+            asyncio.get_event_loop().call_later(self.CallbackTtl, self.callbacks.pop, callback_id, None)
+        self.conn.send(('emit', event, data, to, room, skip_sid, callback_id))
+
+    async def send(self, data, to=None, room=None, skip_sid=None):
+        self.conn.send(('send', data, to, room, skip_sid))
+
+    async def call(self, event, data=None, to=None, timeout=60):
+        request_id = next(self.request_id)
+        future = asyncio.get_event_loop().create_future()
+        self.requests[request_id] = future
+        self.conn.send(('call', request_id, event, data, to, timeout))
+        try:
+            return await asyncio.wait_for(future, timeout + self.ResultGrace)
+        except asyncio.TimeoutError:
+            raise exceptions.TimeoutError()
+        finally:
+            self.requests.pop(request_id, None)
+
+    def on_callback(self, callback_id, args):
+        callback = self.callbacks.pop(callback_id, None)
+        if callback is not None:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+
+    def on_result(self, request_id, timed_out, value):
+        future = self.requests.get(request_id)
+        if future is not None and not future.done():
+            if timed_out:
+                future.set_exception(exceptions.TimeoutError())
+            else:
+                future.set_result(value)
+
+
+class _Worker:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.sio = RemoteSocket(conn)
+        self.games: Dict[str, asyncio.Task] = {}
+
+    async def run(self):
+        messages = asyncio.Queue()
+        _start_reader(self.conn, messages.put_nowait)
+        while True:
+            message = await messages.get()
+            if message is None:
+                break
+
+            kind, *args = message
+            if kind == 'start':
+                self.start_game(*args)
+            elif kind == 'abort':
+                task = self.games.get(args[0])
+                if task is not None:
+                    task.cancel()
+            elif kind == 'callback':
+                self.sio.on_callback(*args)
+            elif kind == 'result':
+                self.sio.on_result(*args)
+            elif kind == 'stop':
+                break
+
+        for task in self.games.values():
+            task.cancel()
+
+    def start_game(self, game_class, settings, game_uuid, owner, players):
+        game = game_class(self.sio, owner, **settings)
+        game.uuid = game_uuid
+        game.logger = game_logger(game_uuid)
+        game.players = {sid: Game.Player(sid, pid, *options) for sid, pid, *options in players}
+        game.metrics = MetricsRegistry()  # Merged into the registry of the server once the game is done
+        task = asyncio.ensure_future(game.start())
+        task.add_done_callback(functools.partial(self.on_game_done, game))
+        self.games[game_uuid] = task
+
+    def on_game_done(self, game: GameInterface, task: asyncio.Task):
+        self.games.pop(game.uuid, None)
+        winner = None
+        if task.cancelled():
+            game.status = Game.Status.Aborted
+        elif task.exception() is not None:
+            game.logger.error('Game %s crashed: %r', game.uuid, task.exception())
+            game.status = Game.Status.Aborted
+        else:
+            winner = task.result()
+        self.conn.send(('done', game.uuid, game.status.name, winner, game.turn, dict(game.round_trips),
+                        game.metrics.dump(), game.trace))
+
+
+def _start_reader(conn, callback):
+    # Read the pipe from a daemon thread and hand each message over to the event loop. None means the pipe is closed.
+    loop = asyncio.get_event_loop()
+
+    def read():
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = None
+            try:
+                loop.call_soon_threadsafe(callback, message)
+            except RuntimeError:
+                break  # The event loop is closed
+            if message is None:
+                break
+
+    threading.Thread(target=read, daemon=True).start()
+
+
+def _worker_main(conn):
+    # Do not reuse a loop inherited from the parent process
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(_Worker(conn).run())
+
+
+class GameProcessPool:
+
+    """Play games in a pool of worker processes.
+
+    The socket.io front end stays in the main process. Each game is rebuilt in the least loaded worker, where it runs
+    against a RemoteSocket. Events are relayed over one duplex pipe per worker.
+    """
+
+    class WorkerHandle:
+
+        def __init__(self, process, conn):
+            self.process = process
+            self.conn = conn
+            self.games: Dict[str, asyncio.Future] = {}
+            self.is_reading = False
+            self.is_alive = True
+
+    def __init__(self, sio, nb_process: Optional[int] = None, on_spawn: Optional[Callable[[int], None]] = None):
+        self.sio = sio
+        self.nb_process = nb_process or os.cpu_count()
+        self.on_spawn = on_spawn  # Called with the pid of each worker process started, the first ones and the respawned
+        self.workers = []
+
+    def start(self):
+        # Start the processes before the event loop is running, so nothing from the loop is inherited by the workers
+        for _ in range(self.nb_process):
+            self.workers.append(self._spawn())
+
+    def stop(self, timeout: float = 5.0):
+        workers, self.workers = self.workers, []  # The workers are not replaced once they exit
+        for worker in workers:
+            self._relay(worker, ('stop',))
+            worker.is_alive = False
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def _spawn(self) -> WorkerHandle:
+        conn, worker_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_main, args=(worker_conn,), daemon=True)
+        process.start()
+        if self.on_spawn is not None:
+            self.on_spawn(process.pid)
+        return GameProcessPool.WorkerHandle(process, conn)
+
+    async def run_game(self, game: GameInterface):
+        worker = min(self.workers, key=lambda w: len(w.games))
+        if not worker.is_reading:
+            _start_reader(worker.conn, functools.partial(self._dispatch, worker))
+            worker.is_reading = True
+
+        future = asyncio.get_event_loop().create_future()
+        players = [(sid, player.pid, player.fused_turn, player.log_level) for sid, player in game.players.items()]
+        game.status = Game.Status.Running
+        try:
+            worker.games[game.uuid] = future
+            worker.conn.send(('start', type(game), game.settings, game.uuid, game.owner, players))
+            status, winner, game.turn, round_trips, game_metrics, trace = await future
+        except asyncio.CancelledError:
+            self._relay(worker, ('abort', game.uuid))
+            raise
+        except OSError as error:
+            # The worker process died before or during the game
+            game.logger.error('Game %s was lost with its worker process: %r', game.uuid, error)
+            worker.games.pop(game.uuid, None)
+            self._on_worker_exit(worker)
+            game.status = Game.Status.Aborted
+            game.last_activity = time.monotonic()
+            await self.sio.emit('game_aborted', game.uuid, room=game.uuid)
+            return None
+        finally:
+            worker.games.pop(game.uuid, None)
+
+        game.status = Game.Status[status]
+        game.round_trips.update(round_trips)
+        game.metrics.merge(game_metrics)
+        game.trace = trace or game.trace
+        game.last_activity = time.monotonic()
+        if winner is not None:
+            game.winner = game.players[winner].pid
+        return winner
+
+    def _on_worker_exit(self, worker: WorkerHandle):
+        # Fail the games of the worker, and replace it unless the pool is stopped
+        if not worker.is_alive:
+            return
+        worker.is_alive = False
+        logger.warning('Worker process %s exited', worker.process.pid)
+        for future in worker.games.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f'Worker process {worker.process.pid} exited'))
+        if worker in self.workers:
+            self.workers[self.workers.index(worker)] = self._spawn()
+
+    def _dispatch(self, worker: WorkerHandle, message):
+        if message is None:
+            self._on_worker_exit(worker)
+            return
+
+        kind, *args = message
+        if kind == 'emit':
+            asyncio.ensure_future(self._emit(worker, *args))
+        elif kind == 'send':
+            data, to, room, skip_sid = args
+            asyncio.ensure_future(self.sio.send(data, to=to, room=room, skip_sid=skip_sid))
+        elif kind == 'call':
+            asyncio.ensure_future(self._call(worker, *args))
+        elif kind == 'done':
+            game_uuid, *result = args
+            future = worker.games.get(game_uuid)
+            if future is not None and not future.done():
+                future.set_result(tuple(result))
+
+    async def _emit(self, worker: WorkerHandle, event, data, to, room, skip_sid, callback_id):
+        callback = None
+        if callback_id is not None:
+            callback = functools.partial(self._relay_callback, worker, callback_id)
+        await self.sio.emit(event, data=data, to=to, room=room, skip_sid=skip_sid, callback=callback)
+
+    async def _call(self, worker: WorkerHandle, request_id, event, data, to, timeout):
+        try:
+            value = await self.sio.call(event, data=data, to=to, timeout=timeout)
+            self._relay(worker, ('result', request_id, False, value))
+        except exceptions.TimeoutError:
+            self._relay(worker, ('result', request_id, True, None))
+
+    @classmethod
+    def _relay_callback(cls, worker: WorkerHandle, callback_id, *args):
+        cls._relay(worker, ('callback', callback_id, args))
+
+    @staticmethod
+    def _relay(worker: WorkerHandle, message):
+        # Nothing to relay once the worker died, its games are aborted
+        if worker.is_alive:
+            with suppress(OSError):
+                worker.conn.send(message)
@@ -0,0 +1,85 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from games.game_interface import GameInterface, Game
+
+
+class GameScheduler:
+
+    """Run games as independent tasks, with a cap on the number of games played at the same time.
+
+    Games started while the cap is reached wait in a FIFO queue until a running game completes. A scheduled game is no
+    longer open to the players.
+    """
+
+    def __init__(self, max_concurrent_games: Optional[int] = None,
+                 runner: Optional[Callable[[GameInterface], Awaitable]] = None):
+        self.max_concurrent_games = max_concurrent_games
+        self.runner = runner or (lambda game: game.start())
+        self.running: Dict[str, asyncio.Task] = {}
+        self.waiting = deque()
+
+    @property
+    def nb_running(self):
+        return len(self.running)
+
+    @property
+    def nb_waiting(self):
+        return len(self.waiting)
+
+    @property
+    def is_saturated(self):
+        return self.max_concurrent_games is not None and self.nb_running >= self.max_concurrent_games
+
+    def __contains__(self, game_uuid):
+        return game_uuid in self.running or any(game.uuid == game_uuid for game in self.waiting)
+
+    def schedule(self, game: GameInterface):
+        if game.uuid in self.running or game in self.waiting:
+            return
+        game.status = Game.Status.Scheduled
+        if self.is_saturated:
+            game.logger.info('Game %s is waiting for a free slot (%s game(s) already waiting)', game.uuid, self.nb_waiting)
+            self.waiting.append(game)
+        else:
+            self._run(game)
+
+    def cancel(self, game_uuid):
+        for game in self.waiting:
+            if game.uuid == game_uuid:
+                self.waiting.remove(game)
+                return True
+
+        task = self.running.get(game_uuid)
+        if task is not None and not task.done():
+            task.cancel()
+            return True
+        return False
+
+    async def shutdown(self):
+        self.waiting.clear()
+        tasks = list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _run(self, game: GameInterface):
+        task = asyncio.ensure_future(self.runner(game))
+        self.running[game.uuid] = task
+        task.add_done_callback(lambda t: self._on_done(game, t))
+
+    def _on_done(self, game: GameInterface, task: asyncio.Task):
+        self.running.pop(game.uuid, None)
+
+        if task.cancelled():
+            game.status = Game.Status.Aborted
+            game.logger.info('Game %s was cancelled', game.uuid)
+        elif task.exception() is not None:
+            game.status = Game.Status.Aborted
+            game.logger.error('Game %s crashed: %r', game.uuid, task.exception())
+
+        while self.waiting and not self.is_saturated:
+            next_game = self.waiting.popleft()
+            if next_game.status == Game.Status.Scheduled:
+                self._run(next_game)
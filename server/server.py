@@ -1,24 +1,55 @@
-import asyncio
 import inspect
+import os
 import socketio
-import random
 
-from typing import Type
+from typing import List, Optional, Type
 
 from games.game_interface import GameInterface, Game
+from games.log import logger
+from games.metrics import metrics
+from server.lifecycle import GameLifecycle
+from server.matchmaking import MatchmakingQueue, OpenGames
+from server.process_pool import GameProcessPool
+from server.scheduler import GameScheduler
+from server.stats import ServerStats
 
 
 class Server(socketio.AsyncNamespace):
 
     current_games = {}
+    protocols = {}  # Options of the clients for the games they join, see GameInterface.add_player
+    open_games = OpenGames()
+    fill_first = False
+    matchmaking = None
     game_class = None 
     sio = None
-    start_lock = asyncio.Lock()
+    scheduler = None
+    process_pool = None
+    lifecycle = None
+    trace_dir = None
+    game_settings = {}  # Keyword arguments of the games, like the timeouts of the players
+    stats = ServerStats()
 
     @classmethod
-    def configure(cls, sio: socketio.Server, game: Type[GameInterface]):
+    def configure(cls, sio: socketio.Server, game: Type[GameInterface], max_concurrent_games: Optional[int] = None,
+                  nb_process: Optional[int] = None, fill_first: bool = False, batch_window: float = 1.0,
+                  idle_ttl: float = 600.0, archive_size: int = 1000, trace_dir: Optional[str] = None,
+                  action_timeout: Optional[float] = None, adaptive_timeout: Optional[bool] = None):
         cls.game_class = game
+        cls.trace_dir = trace_dir
+        cls.game_settings = {'action_timeout': action_timeout, 'adaptive_timeout': adaptive_timeout,
+                             'trace': trace_dir is not None}
+        if trace_dir is not None:
+            os.makedirs(trace_dir, exist_ok=True)
         cls.sio = sio
+        cls.fill_first = fill_first
+        cls.scheduler = GameScheduler(max_concurrent_games, runner=cls.run_game)
+        cls.matchmaking = MatchmakingQueue(game.MinPlayer, game.MaxPlayer, cls.start_matched_game, batch_window)
+        cls.lifecycle = GameLifecycle(cls.current_games, cls.open_games, cls.scheduler, cls.abort_game,
+                                      idle_ttl=idle_ttl, archive_size=archive_size)
+        if nb_process is not None:
+            cls.process_pool = GameProcessPool(sio, nb_process, on_spawn=cls.stats.pids.append)
+            cls.process_pool.start()
 
         server_methods = [m[0] for m in inspect.getmembers(cls, predicate=inspect.isfunction) if m[0].startswith('on_')]
         for method in inspect.getmembers(cls.game_class, predicate=inspect.ismethod):
@@ -27,88 +58,168 @@ class Server(socketio.AsyncNamespace):
             if method[0].startswith('on_'):
                 cls.sio.on(method[0][3:], handler=method[1])
 
+    @classmethod
+    async def shutdown(cls, app=None):
+        # Cancel the running and waiting games, then stop the worker processes. Registered on the shutdown of the app
+        await cls.scheduler.shutdown()
+        if cls.process_pool is not None:
+            cls.process_pool.stop()
+
     async def on_connect(self, sid, environ):
-        print(f'Client {sid} connected')
+        self.lifecycle.start()
+        logger.info('Client %s connected', sid)
         await self.sio.send(f'Connected to {Server.game_class.__name__} server', room=sid)
 
+    async def on_set_protocol(self, sid, options):
+        self.protocols[sid] = {
+            'fused_turn': bool(options.get('fused_turn', False)),
+            'log_level': Game.LogLevel(options.get('log_level', Game.LogLevel.Off)),
+        }
+
+    async def on_game_counts(self, sid):
+        return self.lifecycle.counts
+
+    async def on_server_stats(self, sid, reset=False):
+        # Used by the benchmarks, see client.benchmark
+        stats = self.stats.snapshot()
+        if reset:
+            self.stats.reset()
+        return stats
+
     async def on_create_game(self, sid):
-        new_game = self.game_class(self.sio, sid)
+        new_game = self.game_class(self.sio, sid, **self.game_settings)
         self.current_games[new_game.uuid] = new_game
+        metrics.games_created.inc()
+        self.open_games.update(new_game)
         await self.sio.send(f'New game created', room=sid)
-        print(f'Client {sid} create a new game {new_game.uuid}')
+        logger.info('Client %s create a new game %s', sid, new_game.uuid)
         return new_game.uuid
 
     async def on_find_random_game(self, sid):
-        available_games = [
-            game for game in self.current_games.values() if game.is_valid]
-        if available_games:
-            return random.choice(available_games).uuid
+        game = self.open_games.fill_first() if self.fill_first else self.open_games.random()
+        if game is not None:
+            return game.uuid
         else:
-            await self.sio.send(f'No game available')
+            await self.sio.send(f'No game available', room=sid)
+
+    async def on_queue_for_game(self, sid):
+        if len(self.sio.rooms(sid)) > 1:
+            await self.sio.send(f'You already are in game {self.sio.rooms(sid)[1]}', room=sid)
+        else:
+            self.matchmaking.join(sid)
+            await self.sio.send(f'Waiting for {self.game_class.__name__} players', room=sid)
+
+    @classmethod
+    async def start_matched_game(cls, sids: List[str]):
+        game = cls.game_class(cls.sio, sids[0], **cls.game_settings)
+        cls.current_games[game.uuid] = game
+        metrics.games_created.inc()
+        for sid in sids:
+            await game.add_player(sid, **cls.protocols.get(sid, {}))
+            cls.sio.enter_room(sid, game.uuid)
+        game.logger.info('Matchmaking created the game %s with %s players', game.uuid, game.nb_player)
+        await cls.sio.send(f'Game {game.uuid} joined', room=game.uuid)
+        cls.scheduler.schedule(game)
 
     async def on_join_game(self, sid, game_uuid):
-        game = self.current_games[game_uuid]
+        game = self.current_games.get(game_uuid)
         if len(self.sio.rooms(sid)) > 1:
             await self.sio.send(f'You already are in game {self.sio.rooms(sid)[1]}', room=sid)
-        elif game_uuid not in self.current_games:
+        elif game is None:
             await self.sio.send(f'Game {game_uuid} does not exists', room=sid)
         elif not game.is_valid:
             await self.sio.send(f'Game {game_uuid} is not available', room=sid)
         elif game.is_full:
             await self.sio.send(f'Game {game_uuid} is full', room=sid)
         else:
-            await game.add_player(sid)
+            await game.add_player(sid, **self.protocols.get(sid, {}))
+            self.open_games.update(game)
             self.sio.enter_room(sid, game_uuid)
             await self.sio.send(f'Game {game_uuid} joined', room=sid)
             await self.sio.send(f'A new player joined the game', room=game_uuid, skip_sid=sid)
             await self.sio.emit('player_joined_game', (game_uuid, game.nb_player, False), room=game_uuid, skip_sid=game.owner)
             await self.sio.emit('player_joined_game', (game_uuid, game.nb_player, True), room=game.owner)
-            print(f'Client {sid} join the game {game_uuid}')
+            logger.info('Client %s join the game %s', sid, game_uuid)
 
     async def leave(self, sid, game_uuid):
         self.sio.leave_room(sid, game_uuid)
+        if game_uuid not in self.current_games:
+            return
         await self.current_games[game_uuid].remove_player(sid)
+        self.open_games.update(self.current_games[game_uuid])
 
-        print(f'Client {sid} left game {game_uuid}')
+        logger.info('Client %s left game %s', sid, game_uuid)
         await self.sio.send(f'Left room {game_uuid}', room=sid)
         await self.sio.send('A player left the game', room=game_uuid)
 
-        if self.current_games[game_uuid].status == Game.Status.Running:
+        if self.current_games[game_uuid].status in {Game.Status.Scheduled, Game.Status.Running}:
             self.current_games[game_uuid].status = Game.Status.Aborted
         elif sid == self.current_games[game_uuid].owner:
             self.current_games[game_uuid].status = Game.Status.Aborted
-            print(f'Game {game_uuid} was closed by the owner')
+            logger.info('Game %s was closed by the owner', game_uuid)
             await self.sio.send(f'Game {game_uuid} was close by owner', room=game_uuid)
         elif self.current_games[game_uuid].nb_player == 0:
             self.current_games[game_uuid].status = Game.Status.Aborted
-            print(f'Game {game_uuid} was removed since there is no player left')
+            logger.info('Game %s was removed since there is no player left', game_uuid)
 
         if self.current_games[game_uuid].status == Game.Status.Aborted:
-            await self.sio.send(f'Game was aborted', room=game_uuid)
-            await self.sio.emit('game_aborted', game_uuid, room=game_uuid)
-            await self.sio.close_room(game_uuid)
+            await self.abort_game(self.current_games[game_uuid])
+
+    @classmethod
+    async def abort_game(cls, game: GameInterface):
+        game.status = Game.Status.Aborted
+        metrics.games_aborted.inc()
+        cls.open_games.remove(game.uuid)
+        cls.scheduler.cancel(game.uuid)
+        await cls.sio.send(f'Game was aborted', room=game.uuid)
+        await cls.sio.emit('game_aborted', game.uuid, room=game.uuid)
+        await cls.sio.close_room(game.uuid)
 
     async def on_disconnect(self, sid):
+        self.matchmaking.leave(sid)
+        self.protocols.pop(sid, None)
         for game in self.sio.rooms(sid):
             if game != sid:
                 await self.leave(sid, game)
 
-        print(f'Client {sid} disconnected')
+        logger.info('Client %s disconnected', sid)
 
     async def on_start_game(self, sid, game_uuid):
-        async with self.start_lock:
-            game = self.current_games[game_uuid]
-            if game.owner != sid:
-                await self.sio.send(f'Only the owner of the game can start the game', room=sid)
-            elif not game.is_ready:
-                await self.sio.send(f'The game cannot start until it is ready', room=sid)
+        game = self.current_games.get(game_uuid)
+        if game is None:
+            await self.sio.send(f'Game {game_uuid} does not exists', room=sid)
+        elif game.owner != sid:
+            await self.sio.send(f'Only the owner of the game can start the game', room=sid)
+        elif not game.is_ready:
+            await self.sio.send(f'The game cannot start until it is ready', room=sid)
+        else:
+            game.logger.info('Client %s started the game %s', sid, game.uuid)
+            self.open_games.remove(game_uuid)
+            # TODO use different socket.io namespace according to the game
+            self.scheduler.schedule(game)
+
+    @classmethod
+    async def run_game(cls, game: GameInterface):
+        await cls.sio.send(f'Game {game.uuid} started', room=game.uuid)
+        cls.stats.sample(cls.scheduler.nb_running)
+        metrics.games_started.inc()
+        try:
+            if cls.process_pool is not None:
+                await cls.process_pool.run_game(game)
             else:
-                await self.sio.send(f'Game {game.uuid} started', room=game_uuid)
-                print(f'Client {sid} started the game {game.uuid}')
-                # TODO start the game in another process
-                # TODO use different socket.io namespace according to the game
                 await game.start()
-                print(f'Game {game.uuid} is completed.')
-                await self.sio.close_room(game.uuid)
-
-
+        except Exception:
+            metrics.games_aborted.inc()  # Crashed, the scheduler aborts the game
+            raise
+        else:
+            # The cancelled games are counted by abort_game
+            if game.status == Game.Status.Finished:
+                metrics.games_finished.inc()
+            else:
+                metrics.games_aborted.inc()
+            cls.stats.record(game)
+            if game.trace is not None:
+                game.trace.save(os.path.join(cls.trace_dir, f'{game.uuid}.json'))
+            game.logger.info('Game %s is completed.', game.uuid)
+        finally:
+            await cls.sio.close_room(game.uuid)
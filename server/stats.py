@@ -0,0 +1,88 @@
+import os
+import resource
+import time
+from collections import defaultdict, deque
+from typing import Iterable, List
+
+from games.game_interface import GameInterface
+
+
+def process_usage(pids: Iterable[int]):
+    # Total cpu time (seconds) and resident memory (bytes) of the processes, read from /proc when it is available
+    cpu, rss = 0.0, 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{pid}/statm') as statm:
+                pages = int(statm.read().split()[1])
+        except OSError:
+            if pid == os.getpid():
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                cpu += usage.ru_utime + usage.ru_stime
+                rss += usage.ru_maxrss * 1024
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        rss += pages * os.sysconf('SC_PAGE_SIZE')
+    return cpu, rss
+
+
+def percentiles(samples, quantiles=(50, 95, 99)):
+    if not samples:
+        return {f'p{q}': None for q in quantiles}
+    samples = sorted(samples)
+    return {f'p{q}': samples[min(len(samples) - 1, round(q / 100 * (len(samples) - 1)))] for q in quantiles}
+
+
+class ServerStats:
+
+    """Throughput and response times of the games completed by the server, since the last reset.
+
+    The response times are the round trips of the events sent by the games to the players, measured by the server.
+    Only the last SampleSize of each event are kept.
+    """
+
+    SampleSize = 100000
+
+    def __init__(self):
+        self.pids: List[int] = [os.getpid()]
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.monotonic()
+        self.games = 0
+        self.turns = 0
+        self.round_trips = defaultdict(lambda: deque(maxlen=self.SampleSize))
+        self.cpu_start, self.rss_start = process_usage(self.pids)
+        self.rss_peak = self.rss_start
+        self.live_peak = 0
+
+    def sample(self, live_games: int):
+        _, rss = process_usage(self.pids)
+        self.rss_peak = max(self.rss_peak, rss)
+        self.live_peak = max(self.live_peak, live_games)
+
+    def record(self, game: GameInterface):
+        self.games += 1
+        self.turns += game.turn
+        for event, seconds in game.round_trips.items():
+            self.round_trips[event].extend(seconds)
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.started_at
+        cpu, rss = process_usage(self.pids)
+        self.rss_peak = max(self.rss_peak, rss)
+        return {
+            'elapsed': elapsed,
+            'games': self.games,
+            'turns': self.turns,
+            'games_per_sec': self.games / elapsed if elapsed else None,
+            'turns_per_sec': self.turns / elapsed if elapsed else None,
+            'round_trips': {event: {'count': len(samples), **percentiles(samples)}
+                            for event, samples in self.round_trips.items()},
+            'cpu_seconds': cpu - self.cpu_start,
+            'cpu_per_game': (cpu - self.cpu_start) / self.games if self.games else None,
+            'rss_bytes': rss,
+            'peak_live_games': self.live_peak,
+            'memory_per_game': (self.rss_peak - self.rss_start) / self.live_peak if self.live_peak else None,
+        }
@@ -0,0 +1,38 @@
+import argparse
+import time
+
+import numpy as np
+
+from games.Coup.batch import CoupBatch
+from client.replay import cross_check
+
+parser = argparse.ArgumentParser(description='Play random games of Coup with the NumPy batch simulator')
+parser.add_argument('-n', '--games', dest='nb_game', default=10000,
+                    type=int, help='Number of games played in lockstep')
+parser.add_argument('--players', dest='nb_player', default=6,
+                    type=int, help='Number of players in each game')
+parser.add_argument('--seed', dest='seed', default=None,
+                    type=int, help='Seed of the simulator')
+parser.add_argument('--check', dest='check', action='store_true',
+                    help='Replay every game through CoupGame, and report the turns where the rules disagree')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    batch = CoupBatch(args.nb_game, args.nb_player, args.seed, record=args.check)
+    start = time.perf_counter()
+    winners = batch.run()
+    elapsed = time.perf_counter() - start
+
+    turns = int(batch.turn.sum())
+    print(f'Played {args.nb_game} games of {args.nb_player} players in {elapsed:.2f}s: '
+          f'{args.nb_game / elapsed:.0f} games/s, {turns / elapsed:.0f} turns/s')
+    print(f'Wins by seat: {np.bincount(winners[winners >= 0], minlength=args.nb_player).tolist()}, '
+          f'ties: {int((winners < 0).sum())}')
+
+    if args.check:
+        mismatches = cross_check(batch)
+        for game, turn, expected, actual, *errors in mismatches:
+            print(f'Game {game} turn {turn}:\n  batch:    {expected}\n  CoupGame: {actual}', *errors, sep='\n  ')
+        print(f'{len(mismatches)} mismatch(es) with CoupGame')
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+
+from client.benchmark import Benchmark, ServerProcess, compare_results, write_results
+from client.util import auto_discover_bots
+from games import CoupGame
+from games.codec import MsgPackCodec
+from games.transport import WireJson
+
+parser = argparse.ArgumentParser(description='Load test of the CoupIO server')
+parser.add_argument('-b', '--bot', dest='bot_name', default='DefaultBot',
+                    type=str, help='Bot played by every client')
+parser.add_argument('-s', '--steps', dest='steps', nargs='+', default=[6, 24, 96],
+                    type=int, help='Number of bots playing at the same time, for each step of the ramp up')
+parser.add_argument('-d', '--duration', dest='duration', default=10.0,
+                    type=float, help='Minimal duration of each step in seconds')
+parser.add_argument('--host', dest='host', default=None,
+                    type=str, help='Address of a running server. Default to a new server started for the benchmark')
+parser.add_argument('--port', dest='port', default=8090,
+                    type=int, help='Port of the server started for the benchmark')
+parser.add_argument('--server-args', dest='server_args', default='',
+                    type=str, help='Arguments given to start_server.py, e.g. "-p 4 --max-games 100"')
+parser.add_argument('--codec', dest='codec', default='msgpack', choices=('msgpack', 'json'),
+                    type=str, help='Serialization of the socket.io packets')
+parser.add_argument('-o', '--output', dest='output', default='benchmark.json',
+                    type=str, help='File where the results are written as json')
+parser.add_argument('--compare', dest='baseline', default=None,
+                    type=str, help='Result file of a previous benchmark to compare with')
+
+
+async def main(args, url):
+    discovered_bots = auto_discover_bots()
+    if args.bot_name not in discovered_bots:
+        raise RuntimeError(f"The bot {args.bot_name} wasn't found in the bots module. Bots found: {list(discovered_bots.keys())}")
+
+    codec = MsgPackCodec(CoupGame.Actions) if args.codec == 'msgpack' else WireJson
+    benchmark = Benchmark(url, CoupGame, discovered_bots[args.bot_name], args.steps, args.duration, json_module=codec)
+    results = await benchmark.run()
+
+    write_results(args.output, vars(args), results)
+    print(f'Results written in {args.output}')
+    if args.baseline:
+        print(compare_results(args.baseline, results))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    # The matchmaking only waits for more players when a group is not full
+    server_args = ['--codec', args.codec, '--batch-window', '0.1', '--log-level', 'OFF', *args.server_args.split()]
+
+    if args.host is not None:
+        asyncio.get_event_loop().run_until_complete(main(args, args.host))
+    else:
+        with ServerProcess(args.port, server_args) as server:
+            asyncio.get_event_loop().run_until_complete(main(args, server.url))
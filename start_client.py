@@ -1,9 +1,12 @@
 import asyncio
-import socketio
 import argparse
 
-from client.client import Client
+from client.client import ClientHost
 from client.util import auto_discover_bots
+from games import CoupGame
+from games.codec import MsgPackCodec
+from games.game_interface import Game
+from games.transport import WireJson
 
 parser = argparse.ArgumentParser(description='Client to play CoupIO')
 parser.add_argument('-b', '--bot', dest='bot_name', default='DefaultBot',
@@ -12,6 +15,17 @@ parser.add_argument('-j', '--join', dest='joined_game_id',
                     type=str, help='Join an existing game using the game uuid')
 parser.add_argument('-r', '--random', dest='is_random',
                     action='store_true', help='Join a random game')
+parser.add_argument('-q', '--queue', dest='is_queued',
+                    action='store_true', help='Wait in the matchmaking queue for a new game')
+parser.add_argument('-v', '--verbosity', dest='verbosity', default='Summary', choices=[l.name for l in Game.LogLevel],
+                    type=str, help='Verbosity of the game log printed at the end of each turn')
+parser.add_argument('-c', '--count', dest='count', default=1,
+                    type=int, help='Number of bots played from this process. Unless they join a given game or the queue, '
+                                   'the first bot creates a game and the others join a random game')
+parser.add_argument('--stagger', dest='stagger', default=0.05,
+                    type=float, help='Delay in seconds between the connections of two bots')
+parser.add_argument('--codec', dest='codec', default='msgpack', choices=('msgpack', 'json'),
+                    type=str, help='Serialization of the socket.io packets. Must be the same on the server and the clients')
 parser.add_argument('--host', dest='host', default='http://localhost:8080',
                     type=str, help='Address of the server')
 
@@ -22,16 +36,20 @@ if args.bot_name not in discovered_bots:
     raise RuntimeError(f"The bot {args.bot_name} wasn't found in the bots module. Bots found: {list(discovered_bots.keys())}")
 
 
-sio = socketio.AsyncClient(reconnection=False, logger=False)  # TODO use custom json decoder for action
-sio.register_namespace(Client())
+codec = MsgPackCodec(CoupGame.Actions) if args.codec == 'msgpack' else WireJson
+host = ClientHost(args.host, json=codec, stagger=args.stagger)
+
+for i in range(args.count):
+    join_random_game = args.is_random or (i > 0 and args.joined_game_id is None)
+    bot = discovered_bots[args.bot_name](args.host, join_random_game, args.joined_game_id, args.is_queued)
+    bot.log_level = Game.LogLevel[args.verbosity]
+    host.add(bot)
 
-bot = discovered_bots[args.bot_name](args.host, args.is_random, args.joined_game_id)
 loop = asyncio.get_event_loop()
 
-print(f'The game will be played with {bot.__class__.__name__} on {args.host}')
+print(f'The game will be played with {args.count} {args.bot_name} on {args.host}')
 
 try:
-    Client.configure(sio, args.host, bot)
-    loop.run_until_complete(Client.start())
+    loop.run_until_complete(host.run())
 except RuntimeError:
     pass
@@ -1,15 +1,63 @@
+import argparse
+
 from aiohttp import web
 import socketio
 
 from games import CoupGame
+from games.codec import MsgPackCodec
+from games.log import configure_logging
+from games.transport import WireJson
+from server.monitoring import add_metrics_route
 from server.server import Server
 
-app = web.Application()
+parser = argparse.ArgumentParser(description='Server to play CoupIO')
+parser.add_argument('--max-games', dest='max_concurrent_games', default=None,
+                    type=int, help='Maximum number of games played at the same time. Other games wait in a queue')
+parser.add_argument('-p', '--processes', dest='nb_process', default=None, type=int, nargs='?', const=0,
+                    help='Play the games in a pool of worker processes. Default to the number of cores')
+parser.add_argument('--fill-first', dest='fill_first', action='store_true',
+                    help='Random players join the game with the most players instead of any open game')
+parser.add_argument('--batch-window', dest='batch_window', default=1.0, type=float,
+                    help='Time the matchmaking queue waits for more players before starting a game')
+parser.add_argument('--idle-ttl', dest='idle_ttl', default=600.0, type=float,
+                    help='Time after which a game waiting without activity is aborted and removed')
+parser.add_argument('--archive-size', dest='archive_size', default=1000, type=int,
+                    help='Number of summaries of removed games kept by the server')
+parser.add_argument('--codec', dest='codec', default='msgpack', choices=('msgpack', 'json'),
+                    type=str, help='Serialization of the socket.io packets. Must be the same on the server and the clients')
+parser.add_argument('--trace-dir', dest='trace_dir', default=None, type=str,
+                    help='Save the timeline of the phases of each game in this directory, in the Chrome trace format')
+parser.add_argument('--action-timeout', dest='action_timeout', default=None, type=float,
+                    help='Time the players have to answer, in seconds. Default to the timeout of the game')
+parser.add_argument('--adaptive-timeout', dest='adaptive_timeout', action='store_true', default=None,
+                    help='Shorten the timeout of the players according to their response time')
+parser.add_argument('--log-level', dest='log_level', default='INFO',
+                    choices=('DEBUG', 'INFO', 'WARNING', 'ERROR', 'OFF'), type=str, help='Level of the server logs')
+parser.add_argument('--log-games', dest='log_games', nargs='+', default=None,
+                    type=str, help='Only log the records of these games, and the ones not about a game')
+parser.add_argument('--log-json', dest='log_json', action='store_true',
+                    help='Write the logs as json lines')
+parser.add_argument('--port', dest='port', default=8080,
+                    type=int, help='Port of the server')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    # Before the worker processes are started, so they log the same way
+    configure_logging(args.log_level, games=args.log_games, json_lines=args.log_json)
+
+    app = web.Application()
 
-sio = socketio.AsyncServer(async_mode='aiohttp', logger=False)  # TODO use custom json encoder for action
-sio.register_namespace(Server())
-sio.attach(app)
+    codec = MsgPackCodec(CoupGame.Actions) if args.codec == 'msgpack' else WireJson
+    sio = socketio.AsyncServer(async_mode='aiohttp', logger=False, json=codec)
+    sio.register_namespace(Server())
+    sio.attach(app)
+    add_metrics_route(app)
 
-Server.configure(sio, CoupGame)
+    Server.configure(sio, CoupGame, max_concurrent_games=args.max_concurrent_games, nb_process=args.nb_process,
+                     fill_first=args.fill_first, batch_window=args.batch_window, idle_ttl=args.idle_ttl,
+                     archive_size=args.archive_size, trace_dir=args.trace_dir, action_timeout=args.action_timeout,
+                     adaptive_timeout=args.adaptive_timeout)
+    app.on_shutdown.append(Server.shutdown)
 
-web.run_app(app)
+    web.run_app(app, port=args.port)
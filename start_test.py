@@ -1,16 +1,36 @@
-import os
-import time
-from multiprocessing import Process
+import argparse
 
-processes = [Process(target=os.system, args=('python start_client.py -r > /dev/null 2>&1',)) for _ in range(5)]
-game_owner = Process(target=os.system, args=('python start_client.py',))
+from client.tournament import Tournament
+from client.util import auto_discover_bots
+from games import CoupGame
 
-game_owner.start()
-time.sleep(0.05)
+parser = argparse.ArgumentParser(description='Self-play tournament between the CoupIO bots')
+parser.add_argument('-b', '--bots', dest='bot_names', nargs='+', default=None,
+                    type=str, help='Bots playing the tournament. Default to every bot found in the bots module')
+parser.add_argument('-n', '--games', dest='nb_game', default=1000,
+                    type=int, help='Number of games to play')
+parser.add_argument('--players', dest='nb_player', default=6,
+                    type=int, help='Number of players in each game')
+parser.add_argument('-p', '--processes', dest='nb_process', default=None,
+                    type=int, help='Number of worker processes. Default to the number of cores')
+parser.add_argument('--chunk', dest='chunk_size', default=50,
+                    type=int, help='Number of games sent at once to a worker process')
+parser.add_argument('--seed', dest='seed', default=None,
+                    type=int, help='Seed of the tournament')
 
-for p in processes:
-    p.start()
 
-game_owner.join()
-for p in processes:
-    p.join()
+if __name__ == '__main__':
+    args = parser.parse_args()
+    discovered_bots = auto_discover_bots()
+
+    if args.bot_names is None:
+        bots = discovered_bots
+    else:
+        missing = [name for name in args.bot_names if name not in discovered_bots]
+        if missing:
+            raise RuntimeError(f"The bots {missing} weren't found in the bots module. Bots found: {list(discovered_bots.keys())}")
+        bots = {name: discovered_bots[name] for name in args.bot_names}
+
+    tournament = Tournament(CoupGame, bots, args.nb_player, args.nb_process, args.chunk_size, args.seed)
+    print(f'Playing {args.nb_game} games of {args.nb_player} players between {sorted(bots)}')
+    print(tournament.run(args.nb_game).summary())